@@ -0,0 +1,101 @@
+"""
+Benchmark spec description rendering for a synthetic suite.
+
+Generates (and imports) a throwaway test module of Spec classes with plain &
+generator test methods, loads it with nose's loader, then times rendering every
+test's spec line and context header the way `SpecPlugin` does: once with all
+memoized descriptions cleared beforehand ("cold") and once reusing them
+("warm").
+
+Usage: python benchmarks/descriptions.py [TESTS ...]
+"""
+from __future__ import print_function
+
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from nose.loader import TestLoader
+
+from spec import plugin
+
+
+CLASSES = 20
+# Arguments yielded by each class' test generator
+CASES = 10
+
+
+def module_source(name, methods):
+    lines = ["from spec import Spec", ""]
+    for c in range(CLASSES):
+        lines.append("class TestDoesThing%dWithoutFuss(Spec):" % c)
+        for m in range(methods):
+            lines.append("    def test_doesnt_break_given_%d_things(self):" % m)
+            lines.append("        pass")
+        lines.append("    def test_generates(self):")
+        lines.append("        for x in range(%d):" % CASES)
+        lines.append("            yield self.checks, x")
+        lines.append("    def checks(self, x): pass")
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def flatten(suite):
+    for test in suite:
+        if hasattr(test, '__iter__'):
+            for inner in flatten(test):
+                yield inner
+        else:
+            yield test
+
+
+def load(root, count):
+    methods = max(count // CLASSES - CASES - 1, 1)
+    name = "bench_descriptions_%d" % count
+    with open(os.path.join(root, name + ".py"), "w") as fd:
+        fd.write(module_source(name, methods))
+    module = importlib.import_module(name)
+    return list(flatten(TestLoader().loadTestsFromModule(module)))
+
+
+def render(tests):
+    for test in tests:
+        plugin.contextDescription(plugin.testContext(test))
+        spec = plugin.testDescription(test)
+        if spec is not None:
+            spec.strip()
+
+
+def clear():
+    plugin.underscored2spec.cache.clear()
+    plugin.camelcase2spec.cache.clear()
+    plugin._context_descriptions.clear()
+
+
+def main(sizes):
+    root = tempfile.mkdtemp()
+    sys.path.insert(0, root)
+    try:
+        print("%8s %16s %16s" % ("tests", "cold usec/test", "warm usec/test"))
+        for size in sizes:
+            tests = load(root, size)
+            clear()
+            start = time.time()
+            render(tests)
+            cold = time.time() - start
+            start = time.time()
+            render(tests)
+            warm = time.time() - start
+            print("%8d %16.2f %16.2f" % (
+                len(tests), cold / len(tests) * 1e6, warm / len(tests) * 1e6,
+            ))
+    finally:
+        sys.path.remove(root)
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [1000, 10000, 50000])
@@ -0,0 +1,77 @@
+"""
+Benchmark (and guard) how much ``import spec`` costs a test module.
+
+Imports spec, the way a test module only wanting ``Spec`` & the assertion
+helpers would, in a fresh interpreter per round, and reports the best
+wall-clock time along with which heavy modules came along for the ride. On
+Python 3.7+ the slowest imports are listed too, as per ``python -X
+importtime``.
+
+With ``--check``, exits non-zero if any of those heavy modules (nose, the spec
+plugin & CLI, doctest) were imported; tox runs it that way.
+
+Usage: python benchmarks/imports.py [--check] [ROUNDS]
+"""
+from __future__ import print_function
+
+import subprocess
+import sys
+
+
+STATEMENT = "from spec import Spec, eq_, ok_, assert_contains"
+# Modules a bare 'import spec' must not drag in.
+HEAVY = ('nose', 'doctest', 'spec.plugin', 'spec.cli')
+# How many of the slowest imports to list.
+SLOWEST = 10
+
+PROBE = """
+import sys, time
+start = time.time()
+%s
+print(time.time() - start)
+print(' '.join(x for x in %r if x in sys.modules))
+""" % (STATEMENT, HEAVY)
+
+
+def measure():
+    output = subprocess.check_output([sys.executable, "-c", PROBE])
+    seconds, heavy = output.decode('utf-8').split("\n")[:2]
+    return float(seconds), heavy.split()
+
+
+def slowest():
+    """
+    Return ``(microseconds, module)`` for the slowest cumulative imports.
+    """
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-c", STATEMENT],
+        stderr=subprocess.PIPE,
+    )
+    _, err = process.communicate()
+    rows = []
+    for line in err.decode('utf-8').splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            rows.append((int(fields[1]), fields[2].rstrip()))
+    return sorted(rows, reverse=True)[:SLOWEST]
+
+
+def main(args):
+    check = '--check' in args
+    args = [x for x in args if x != '--check']
+    rounds = int(args[0]) if args else 5
+    results = [measure() for _ in range(rounds)]
+    best = min(seconds for seconds, _ in results)
+    heavy = results[0][1]
+    print("%s: %.2f msec (best of %d)" % (STATEMENT, best * 1e3, rounds))
+    print("heavy modules imported: %s" % (", ".join(heavy) or "none"))
+    if sys.version_info >= (3, 7):
+        print("\n%12s  %s" % ("cumul. usec", "module"))
+        for usec, module in slowest():
+            print("%12d  %s" % (usec, module))
+    if check and heavy:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
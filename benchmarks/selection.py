@@ -0,0 +1,106 @@
+"""
+Benchmark SpecSelector against synthetic suites of growing size.
+
+Generates (and imports) a throwaway tree of test modules -- Spec classes atop a
+chain of private helper bases -- then times only the selection calls nose's
+loader would make against it: wantModule per module, wantClass/wantFunction
+per member and wantMethod per method. Selection time per module should stay
+flat as the suite grows.
+
+Usage: python benchmarks/selection.py [MODULES ...]
+"""
+from __future__ import print_function
+
+import importlib
+import inspect
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from nose.config import Config
+
+from spec.cli import SpecSelector
+from spec.utils import class_members
+
+
+CLASSES = 5
+METHODS = 5
+FUNCTIONS = 5
+# Depth of the private helper class hierarchy test classes inherit from.
+DEPTH = 5
+
+
+def module_source(index):
+    lines = ["from spec import Spec", ""]
+    parent = "Spec"
+    for d in range(DEPTH):
+        lines.append("class _Base%d(%s):" % (d, parent))
+        for m in range(METHODS):
+            lines.append("    def helps_%d_%d(self): pass" % (d, m))
+        lines.append("")
+        parent = "_Base%d" % d
+    for c in range(CLASSES):
+        lines.append("class Thing%d_%d(%s):" % (index, c, parent))
+        for m in range(METHODS):
+            lines.append("    def does_thing_%d(self): pass" % m)
+        lines.append("    def _helper(self): pass")
+        lines.append("    class inner:")
+        lines.append("        def also_does_things(self): pass")
+        lines.append("")
+    for f in range(FUNCTIONS):
+        lines.append("def test_function_%d(): pass" % f)
+    return "\n".join(lines) + "\n"
+
+
+def generate(root, count):
+    names = []
+    for index in range(count):
+        name = "bench_selection_%d_%d" % (count, index)
+        with open(os.path.join(root, name + ".py"), "w") as fd:
+            fd.write(module_source(index))
+        names.append(name)
+    return [importlib.import_module(x) for x in names]
+
+
+def select(modules):
+    selector = SpecSelector(Config())
+    for module in modules:
+        selector.wantModule(module)
+        for name, obj in vars(module).items():
+            if inspect.isclass(obj):
+                if selector.wantClass(obj):
+                    pending = [obj]
+                    while pending:
+                        cls = pending.pop()
+                        instance = cls()
+                        for attr in dir(cls):
+                            value = getattr(instance, attr, None)
+                            if inspect.ismethod(value):
+                                selector.wantMethod(value)
+                        pending.extend(x for _, x in class_members(cls))
+            elif inspect.isfunction(obj):
+                selector.wantFunction(obj)
+
+
+def main(sizes):
+    root = tempfile.mkdtemp()
+    sys.path.insert(0, root)
+    try:
+        print("%8s %12s %16s" % ("modules", "seconds", "usec/module"))
+        for size in sizes:
+            modules = generate(root, size)
+            start = time.time()
+            select(modules)
+            elapsed = time.time() - start
+            print("%8d %12.3f %16.1f" % (
+                size, elapsed, elapsed / size * 1e6
+            ))
+    finally:
+        sys.path.remove(root)
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [250, 500, 1000, 2000, 4000])
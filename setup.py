@@ -25,7 +25,8 @@ setup(
             'specselector = spec.cli:CustomSelector',
         ],
         'console_scripts': [
-            'spec = spec:main'
+            'spec = spec:main',
+            'spec-merge = spec.merge:main',
         ],
     },
     classifiers=[
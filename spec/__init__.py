@@ -1,22 +1,72 @@
 from __future__ import unicode_literals
 
+import importlib
 import re
+import sys
+from collections import OrderedDict
 from functools import partial
 
 import six
 
-from nose import SkipTest
-# Gets us eq_, ok_, etc
-# TODO: see what I or others are using here and make explicit, ugh
-from nose.tools import *
-from nose.tools import ok_ as upstream_ok_
-
-from spec.plugin import SpecPlugin
-from spec.cli import main
+from spec.contexts import fixture
 from spec.utils import InnerClassParser, hide
+# Light enough to import up front, and must be: importing the spec.trap
+# submodule from anywhere would otherwise leave it shadowing the decorator.
 from spec.trap import trap
 
 
+# Names importing nose or spec's runner machinery, loaded on first use so that
+# test modules only wanting Spec or eq_ (and every worker process) don't pay
+# for them: name -> (module, attribute).
+_lazy = {
+    'SkipTest': ('nose', 'SkipTest'),
+    'upstream_ok_': ('nose.tools', 'ok_'),
+    'SpecPlugin': ('spec.plugin', 'SpecPlugin'),
+    # Tries a running `spec --daemon` before falling back to spec.cli's.
+    'main': ('spec.daemon', 'main'),
+}
+# Gets us the rest of nose.tools (assert_equal, raises, etc), minus the ok_ &
+# eq_ shadowed below.
+_nose_tools = (
+    'make_decorator', 'raises', 'set_trace', 'timed', 'with_setup',
+    'TimeExpired', 'istest', 'nottest',
+)
+
+
+def _load(name):
+    if name in _lazy:
+        module, attribute = _lazy[name]
+    elif name in _nose_tools or name.startswith('assert_'):
+        module, attribute = 'nose.tools', name
+    else:
+        raise AttributeError(
+            "module %r has no attribute %r" % (__name__, name)
+        )
+    value = getattr(importlib.import_module(module), attribute)
+    globals()[name] = value
+    return value
+
+
+def _load_all():
+    tools = importlib.import_module('nose.tools')
+    for name in list(_lazy) + list(tools.__all__):
+        if name not in globals():
+            _load(name)
+
+
+def __getattr__(name):
+    # 'from spec import *' asks for __all__; give it everything, as before.
+    if name == '__all__':
+        _load_all()
+        return [x for x in globals() if not x.startswith('_')]
+    return _load(name)
+
+
+# No module-level __getattr__ before Python 3.7: load it all up front.
+if sys.version_info < (3, 7):
+    _load_all()
+
+
 class Spec(six.with_metaclass(InnerClassParser, object)):
     """
     Parent class for spec classes wishing to use inner class contexts.
@@ -25,25 +75,66 @@ class Spec(six.with_metaclass(InnerClassParser, object)):
 
 # Simple helper
 def skip():
+    from nose import SkipTest
     raise SkipTest
 
 
-# Multiline string comparison helper ripped from Fabric 1.x
-def eq_(result, expected, msg=None):
-    """
-    Shadow of the Nose builtin which presents easier to read multiline output.
-    """
-    params = {'expected': expected, 'result': result}
-    aka = """
+# Strings with more lines than this, on either side, get a diff rather than
+# being printed in full when eq_() fails...
+DIFF_THRESHOLD = 20
+# ...showing at most this many lines of it.
+DIFF_LIMIT = 100
+# Longest haystack (in characters) shown whole when assert_contains() fails.
+HAYSTACK_LIMIT = 2000
+# How many compiled assert_contains() needles to keep around.
+PATTERN_CACHE_SIZE = 256
 
---------------------------------- aka -----------------------------------------
 
-Expected:
-%(expected)r
+def _encode(msg):
+    # Nose's failure handling at some point calls explicit str() - which will
+    # UnicodeDecodeError on any non ASCII text.
+    # To work around this, we make sure Unicode strings become bytestrings
+    # beforehand, with explicit encode.
+    if isinstance(msg, six.text_type):
+        msg = msg.encode('utf-8')
+    return msg
 
-Got:
-%(result)r
-""" % params
+
+def _diff_message(result, expected):
+    """
+    Unified diff of two large multiline strings, cut off after `DIFF_LIMIT`
+    lines.
+
+    Line endings are compared too: carriage returns show as ``\\r`` and a
+    missing final newline as in diff(1).
+    """
+    import difflib
+    lines = []
+    for line in difflib.unified_diff(
+        expected.splitlines(True), result.splitlines(True),
+        'expected', 'got', lineterm='',
+    ):
+        if line.endswith("\n"):
+            line = line[:-1]
+        elif line[:1] in "+-" and not line.startswith(("+++", "---")):
+            line += "\n\\ No newline at end of file"
+        lines.append(line.replace("\r", "\\r"))
+    if len(lines) > DIFF_LIMIT:
+        omitted = len(lines) - DIFF_LIMIT
+        lines = lines[:DIFF_LIMIT] + ["... %d more diff line%s ..." % (
+            omitted, "s" if omitted != 1 else "",
+        )]
+    return "\n%s\n" % "\n".join(lines)
+
+
+def _eq_message(result, expected):
+    if (
+        isinstance(result, six.string_types)
+        and isinstance(expected, six.string_types)
+        and max(result.count("\n"), expected.count("\n")) > DIFF_THRESHOLD
+    ):
+        return _diff_message(result, expected)
+    params = {'expected': expected, 'result': result}
     default_msg = """
 Expected:
 %(expected)s
@@ -55,26 +146,70 @@ Got:
         (repr(result) != six.text_type(result)) or
         (repr(expected) != six.text_type(expected))
     ):
-        default_msg += aka
-    assertion_msg = msg or default_msg
-    # This assert will bubble up to Nose's failure handling, which at some
-    # point calls explicit str() - which will UnicodeDecodeError on any non
-    # ASCII text.
-    # To work around this, we make sure Unicode strings become bytestrings
-    # beforehand, with explicit encode.
-    if isinstance(assertion_msg, six.text_type):
-        assertion_msg = assertion_msg.encode('utf-8')
-    assert result == expected, assertion_msg
+        default_msg += """
+
+--------------------------------- aka -----------------------------------------
+
+Expected:
+%(expected)r
+
+Got:
+%(result)r
+""" % params
+    return default_msg
+
+
+# Multiline string comparison helper ripped from Fabric 1.x
+def eq_(result, expected, msg=None):
+    """
+    Shadow of the Nose builtin which presents easier to read multiline output.
+
+    The failure message is only built when the comparison fails; large
+    multiline strings are shown as a (bounded) diff.
+    """
+    if result == expected:
+        return
+    raise AssertionError(_encode(msg or _eq_message(result, expected)))
 
 
 # Unicode-friendlier ok_
 def ok_(assertion, msg=None):
-    if msg is not None:
-        # Same as in eq_ above re: need to correctly encode before nose calls
-        # str()...
-        if isinstance(msg, six.text_type):
-            msg = msg.encode('utf-8')
-    upstream_ok_(assertion, msg)
+    # Same as nose.tools.ok_, minus importing nose.
+    if not assertion:
+        raise AssertionError(_encode(msg) if msg is not None else msg)
+
+
+def _truncate(text, limit=HAYSTACK_LIMIT):
+    if len(text) <= limit:
+        return text
+    keep = limit // 2
+    return "%s\n... %d characters omitted ...\n%s" % (
+        text[:keep], len(text) - 2 * keep, text[-keep:],
+    )
+
+
+_patterns = OrderedDict()
+
+
+def _pattern(needle):
+    """
+    Return ``needle`` compiled (multiline), via a bounded LRU cache.
+    """
+    try:
+        pattern = _patterns.pop(needle)
+    except KeyError:
+        pattern = re.compile(needle, re.M)
+        if len(_patterns) >= PATTERN_CACHE_SIZE:
+            _patterns.popitem(last=False)
+    _patterns[needle] = pattern
+    return pattern
+
+
+def _contains(haystack, needle, escape):
+    if escape:
+        # Escaped needles are plain text; no need for the regex engine.
+        return needle in haystack
+    return _pattern(needle).search(haystack) is not None
 
 
 def _assert_contains(haystack, needle, invert, escape=False):
@@ -84,14 +219,31 @@ def _assert_contains(haystack, needle, invert, escape=False):
     Say ``escape`` to escape the ``needle`` if you aren't really using the
     regex feature & have special characters in it.
     """
-    myneedle = re.escape(needle) if escape else needle
-    matched = re.search(myneedle, haystack, re.M)
+    matched = _contains(haystack, needle, escape)
     if (invert and matched) or (not invert and not matched):
         raise AssertionError("'%s' %sfound in '%s'" % (
             needle,
             "" if invert else "not ",
-            haystack
+            _truncate(haystack),
         ))
 
 assert_contains = partial(_assert_contains, invert=False)
 assert_not_contains = partial(_assert_contains, invert=True)
+
+
+def assert_contains_all(haystack, needles, escape=False):
+    """
+    Test that every one of ``needles`` is found within ``haystack``.
+
+    Like calling `assert_contains` for each needle, but reports every missing
+    needle at once.
+    """
+    # Searching per needle (cached patterns, or substrings if escaped) beats
+    # a single pass with one big alternation: re can then skip ahead using
+    # each needle's literal prefix instead of trying them all everywhere.
+    missing = [x for x in needles if not _contains(haystack, x, escape)]
+    if missing:
+        raise AssertionError("%s not found in '%s'" % (
+            ", ".join("'%s'" % x for x in missing),
+            _truncate(haystack),
+        ))
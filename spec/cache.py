@@ -0,0 +1,140 @@
+"""
+Small on-disk state store shared by spec's various "remember between runs"
+features.
+
+Everything lives as JSON files under ``.spec_cache/`` in the directory spec was
+launched from (override with ``NOSE_SPEC_CACHE_DIR``). A missing or corrupt
+file is treated as empty rather than as an error -- it's only a cache, after
+all.
+"""
+import hashlib
+import json
+import os
+import sys
+import unittest
+
+import nose
+
+
+# Nose's --where changes directory before plugins get configured, so remember
+# where we started out.
+launch_dir = os.getcwd()
+
+
+def cache_dir(env=os.environ):
+    return os.path.join(
+        launch_dir, env.get('NOSE_SPEC_CACHE_DIR') or '.spec_cache'
+    )
+
+
+def load(name, default=None):
+    """
+    Return the data stored under ``name``, or ``default`` if there is none.
+    """
+    try:
+        with open(os.path.join(cache_dir(), name)) as fd:
+            return json.load(fd)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def save(name, data):
+    """
+    Store ``data`` under ``name``, replacing any previous value atomically.
+    """
+    directory = cache_dir()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, name)
+    with open(path + '.tmp', 'w') as fd:
+        json.dump(data, fd)
+    os.rename(path + '.tmp', path)
+
+
+def source_file(path):
+    """
+    Normalize a module ``__file__`` to its source file (i.e. drop ``.pyc``.)
+    """
+    if path.endswith(('.pyc', '.pyo')):
+        path = path[:-1]
+    return os.path.abspath(path)
+
+
+def module_file(obj):
+    """
+    Return the (source) file ``obj`` was defined in, or None if it has none.
+    """
+    module = sys.modules.get(getattr(obj, '__module__', None))
+    path = getattr(module, '__file__', None)
+    return source_file(path) if path else None
+
+
+def digest(path):
+    with open(path, 'rb') as fd:
+        return hashlib.sha1(fd.read()).hexdigest()
+
+
+def stamp(path):
+    """
+    Return a ``[mtime, size, sha1]`` stamp for ``path``.
+    """
+    stat = os.stat(path)
+    return [stat.st_mtime, stat.st_size, digest(path)]
+
+
+def is_fresh(path, old):
+    """
+    Is ``path`` unchanged since ``old`` (a `stamp`) was taken?
+
+    Matching mtime & size is taken as proof; otherwise the content hash is
+    compared, and ``old`` is updated in place when only the mtime moved.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    mtime, size, sha1 = old
+    if stat.st_mtime == mtime and stat.st_size == size:
+        return True
+    if stat.st_size != size or digest(path) != sha1:
+        return False
+    old[0] = stat.st_mtime
+    return True
+
+
+def class_path(cls):
+    """
+    Dotted name of ``cls`` within its module, following inner class links.
+    """
+    names = [cls.__name__]
+    while '_parent' in vars(cls):
+        cls = cls._parent
+        names.insert(0, cls.__name__)
+    return '.'.join(names)
+
+
+def test_address(test):
+    """
+    Return a nose-style ``(filename, module, call)`` address for ``test``.
+
+    Unlike nose's own addresses, ``call`` spells out the outer classes of any
+    `Spec` inner class involved, so it may be fed back to nose as
+    ``filename:call``. Returns None for tests lacking an address.
+    """
+    address = getattr(test, 'address', None)
+    address = address() if address else None
+    if not address:
+        return None
+    filename, module, call = address
+    case = getattr(test, 'test', None)
+    # nose method tests know their class; plain TestCases are their class.
+    cls = getattr(case, 'cls', None)
+    if (
+        cls is None
+        and isinstance(case, unittest.TestCase)
+        and not isinstance(case, nose.case.TestBase)
+    ):
+        cls = type(case)
+    if cls is not None and call:
+        call = "%s.%s" % (class_path(cls), call.rpartition('.')[2])
+    return (source_file(filename) if filename else None, module, call)
@@ -0,0 +1,184 @@
+"""
+Dependency tracking for ``spec --changed``.
+
+While active, every ``import`` statement (and ``importlib.import_module``
+call) is recorded as an edge from the importing module to the imported one.
+After a run, each test module's dependencies are the project files (i.e. those
+under the directory spec was launched from, outside any installed packages)
+reachable from it through those edges; they're stamped and stored so the next
+run can skip test modules none of whose files changed.
+"""
+import importlib
+import os
+import site
+import sys
+import sysconfig
+from collections import defaultdict
+
+import six
+from six.moves import builtins
+
+from spec import cache
+
+
+def module_name(name, importer, level):
+    """
+    Return the absolute module name an ``__import__`` call refers to.
+    """
+    if level <= 0:
+        return name
+    package = importer.get('__package__')
+    if package is None:
+        package = importer.get('__name__', '')
+        if '__path__' not in importer:
+            package = package.rpartition('.')[0]
+    base = package.rsplit('.', level - 1)[0]
+    return "%s.%s" % (base, name) if name else base
+
+
+class ImportRecorder(object):
+    """
+    Wraps ``__import__`` and ``importlib.import_module`` to record which
+    modules import which others.
+
+    Only ``import_module`` calls looked up on the ``importlib`` module after
+    `install` are seen, not references to it taken beforehand.
+    """
+    def __init__(self):
+        self.edges = defaultdict(set)
+        self.original = None
+        self.original_import_module = None
+
+    def install(self):
+        self.original = builtins.__import__
+        self.original_import_module = importlib.import_module
+        builtins.__import__ = self.__import__
+        importlib.import_module = self.import_module
+
+    def uninstall(self):
+        if self.original is not None:
+            builtins.__import__ = self.original
+            importlib.import_module = self.original_import_module
+            self.original = self.original_import_module = None
+
+    def record(self, importer, target, fromlist=()):
+        """
+        Record that module ``importer`` imported ``target`` (and the names in
+        ``fromlist`` from it.)
+        """
+        names = [target] + ["%s.%s" % (target, x) for x in fromlist or ()]
+        # Pull in parent packages too, their __init__ runs on import.
+        while '.' in target:
+            target = target.rpartition('.')[0]
+            names.append(target)
+        self.edges[importer].update(x for x in names if x in sys.modules)
+
+    def __import__(self, name, globals=None, locals=None, fromlist=(),
+                   level=0):
+        module = self.original(name, globals, locals, fromlist, level)
+        importer = (globals or {}).get('__name__')
+        if importer:
+            self.record(importer, module_name(name, globals, level), fromlist)
+        return module
+
+    def import_module(self, name, package=None):
+        module = self.original_import_module(name, package)
+        importer = sys._getframe(1).f_globals.get('__name__')
+        if importer:
+            # Relative names were resolved against ``package`` already.
+            self.record(importer, module.__name__)
+        return module
+
+    def reachable(self, name):
+        """
+        Return the names of all modules ``name`` (transitively) imported.
+        """
+        seen, pending = set(), [name]
+        while pending:
+            for target in self.edges.get(pending.pop(), ()):
+                if target not in seen:
+                    seen.add(target)
+                    pending.append(target)
+        return seen
+
+
+# sysconfig install paths holding modules (unlike e.g. 'data', aka sys.prefix)
+LIBRARY_PATHS = ('stdlib', 'platstdlib', 'purelib', 'platlib')
+
+
+def install_dirs():
+    """
+    Return the directories Python & installed packages live in, each with a
+    trailing separator.
+    """
+    paths = sysconfig.get_paths()
+    dirs = set(paths[x] for x in LIBRARY_PATHS if x in paths)
+    # Not all versions of site (e.g. old virtualenvs') offer these.
+    if hasattr(site, 'getsitepackages'):
+        dirs.update(site.getsitepackages())
+    if hasattr(site, 'getusersitepackages'):
+        dirs.add(site.getusersitepackages())
+    return [os.path.join(os.path.abspath(x), '') for x in dirs if x]
+
+
+def is_project_file(path, installed):
+    """
+    Is ``path`` under the launch directory, but not within any of the
+    ``installed`` directories (e.g. those of a virtualenv living there)?
+    """
+    root = os.path.join(cache.launch_dir, '')
+    return path.startswith(root) and not any(
+        path.startswith(x) for x in installed
+    )
+
+
+class ChangedIndex(object):
+    """
+    Per test module record of the project files it depended on when it last
+    passed.
+    """
+    filename = 'changed.json'
+
+    def __init__(self):
+        self.entries = cache.load(self.filename, {})
+        self.installed = install_dirs()
+        self.recorder = ImportRecorder()
+        self.recorder.install()
+
+    def unchanged(self, path):
+        """
+        Did the test module at ``path`` pass last time, with none of its
+        recorded dependencies having changed since?
+        """
+        deps = self.entries.get(os.path.abspath(path))
+        return deps is not None and all(
+            cache.is_fresh(dep, old) for dep, old in six.iteritems(deps)
+        )
+
+    def dependencies(self, module):
+        files = set([cache.source_file(module.__file__)])
+        for name in self.recorder.reachable(module.__name__):
+            path = getattr(sys.modules.get(name), '__file__', None)
+            path = path and cache.source_file(path)
+            if path and is_project_file(path, self.installed):
+                files.add(path)
+        return files
+
+    def update(self, modules, failed):
+        """
+        Record dependencies for each of ``modules`` which ran, forgetting any
+        whose file is in ``failed`` so they always run next time.
+        """
+        self.recorder.uninstall()
+        for module in modules:
+            if not getattr(module, '__file__', None):
+                continue
+            path = cache.source_file(module.__file__)
+            if path in failed:
+                self.entries.pop(path, None)
+            else:
+                self.entries[path] = dict(
+                    (x, cache.stamp(x)) for x in self.dependencies(module)
+                    if os.path.exists(x)
+                )
+        cache.save(self.filename, self.entries)
@@ -5,6 +5,9 @@ import os
 import nose
 import six
 
+from spec import cache
+from spec.cache import class_path, module_file, test_address
+from spec.changed import ChangedIndex
 from spec.utils import class_members
 
 
@@ -20,11 +23,23 @@ def private(obj):
 
 class SpecSelector(nose.selector.Selector):
     def __init__(self, *args, **kwargs):
+        # Optional ChangedIndex for skipping unchanged test modules (--changed)
+        self.changed = kwargs.pop('changed', None)
+        # (filename, call) addresses of tests loaded by name (e.g. by
+        # --spec-failed-first) which must not be selected a second time
+        self.preloaded = kwargs.pop('preloaded', frozenset())
         super(SpecSelector, self).__init__(*args, **kwargs)
-        self._valid_modules = []
+        # Modules & classes are keyed by id() for O(1) identity lookups; the
+        # values keep the objects (and thus their ids) alive.
+        self._valid_modules = {}
         # Handle --tests=
-        self._valid_named_modules = list(map(os.path.abspath, self.config.testNames))
-        self._valid_classes = []
+        self._valid_named_modules = set(map(os.path.abspath, self.config.testNames))
+        self._valid_classes = {}
+        # Memoized inspect.getmodule() results, keyed the same way.
+        self._modules = {}
+        # Memoized attribute names inherited by / available on each class.
+        self._inherited = {}
+        self._available = {}
 
     def wantDirectory(self, dirname):
         # Given a sane root such as tests/, we want everything.
@@ -37,28 +52,62 @@ class SpecSelector(nose.selector.Selector):
         # Also skip .pyc files
         is_pyc = os.path.splitext(filename)[1] == '.pyc'
         is_hidden = os.path.basename(filename).startswith('_')
-        return not (is_pyc or is_hidden)
+        # With --changed, also skip modules which passed last time & whose
+        # dependencies haven't changed since.
+        unchanged = (
+            self.changed is not None
+            and filename.endswith('.py')
+            and self.changed.unchanged(filename)
+        )
+        return not (is_pyc or is_hidden or unchanged)
 
     def wantModule(self, module):
         # You guessed it -- if it's being picked up as a module, we want it.
         # However, also store it so we can tell apart "native" class/func
         # objects from ones imported *into* test modules.
-        self._valid_modules.append(module)
+        self._valid_modules[id(module)] = module
         return True
 
+    def getModule(self, obj):
+        """
+        Memoized `inspect.getmodule`.
+        """
+        key = id(obj)
+        if key not in self._modules:
+            self._modules[key] = (obj, inspect.getmodule(obj))
+        return self._modules[key][1]
+
+    def isValidModule(self, module):
+        """
+        Was ``module`` picked up by discovery, or loaded by file name?
+        """
+        return id(module) in self._valid_modules or (
+            hasattr(module, '__file__')
+            and module.__file__ in self._valid_named_modules
+        )
+
     def wantFunction(self, function):
         # Only use locally-defined functions
-        local = inspect.getmodule(function) in self._valid_modules
+        local = self.isValidModule(self.getModule(function))
         # And not ones which are conventionally private
         good = local and not private(function)
-        return good
+        return good and not self.isPreloaded(function, function.__name__)
+
+    def isPreloaded(self, obj, call):
+        """
+        Was the test at ``call``, in the file defining ``obj``, loaded by name?
+        """
+        return (
+            bool(self.preloaded)
+            and (module_file(obj), call) in self.preloaded
+        )
 
     def registerGoodClass(self, class_):
         """
         Internal bookkeeping to handle nested classes
         """
         # Class itself added to "good" list
-        self._valid_classes.append(class_)
+        self._valid_classes[id(class_)] = class_
         # Recurse into any inner classes
         for name, cls in class_members(class_):
             if self.isValidClass(cls):
@@ -69,14 +118,7 @@ class SpecSelector(nose.selector.Selector):
         Needs to be its own method so it can be called from both wantClass and
         registerGoodClass.
         """
-        module = inspect.getmodule(class_)
-        valid = (
-            module in self._valid_modules
-            or (
-                hasattr(module, '__file__')
-                and module.__file__ in self._valid_named_modules
-            )
-        )
+        valid = self.isValidModule(self.getModule(class_))
         return valid and not private(class_)
 
     def wantClass(self, class_):
@@ -98,7 +140,7 @@ class SpecSelector(nose.selector.Selector):
 
         # As with functions, we want only items defined on also-valid
         # containers (classes), and only ones not conventionally private.
-        valid_class = cls in self._valid_classes
+        valid_class = id(cls) in self._valid_classes
         # And ones only defined local to the class in question, not inherited
         # from its parents. Also handle oddball 'type' cases.
         if cls is type:
@@ -106,29 +148,170 @@ class SpecSelector(nose.selector.Selector):
         # Handle 'contributed' methods not defined on class itself
         if not hasattr(cls, method.__name__):
             return False
-        # Only test for mro on new-style classes. (inner old-style classes lack
-        # it.)
-        if hasattr(cls, '__mro__'):
-            candidates = list(reversed(cls.__mro__))[:-1]
-            for candidate in candidates:
-                if hasattr(candidate, method.__name__):
-                    return False
+        if not self.definedLocally(cls, method.__name__):
+            return False
         ok = valid_class and not private(method)
-        return ok
+        call = "%s.%s" % (class_path(cls), method.__name__)
+        return ok and not self.isPreloaded(cls, call)
+
+    def definedLocally(self, cls, name):
+        """
+        Is attribute ``name`` defined on ``cls`` itself, not inherited?
+        """
+        return name not in self.inheritedNames(cls)
+
+    def inheritedNames(self, cls):
+        """
+        Return a frozenset of every attribute name ``cls`` inherits.
+
+        Computed once per class for the lifetime of this selector (and thus
+        its loader.)
+        """
+        key = id(cls)
+        if key not in self._inherited:
+            names = frozenset()
+            # Only test for mro on new-style classes. (inner old-style classes
+            # lack it.)
+            if hasattr(cls, '__mro__'):
+                # dir() of a base already covers that base's own ancestors.
+                bases = [self.availableNames(x) for x in cls.__bases__]
+                names = bases[0] if len(bases) == 1 else names.union(*bases)
+            self._inherited[key] = (cls, names)
+        return self._inherited[key][1]
+
+    def availableNames(self, cls):
+        """
+        Return a frozenset of every attribute name ``hasattr`` finds on ``cls``.
+
+        Memoized per class like `inheritedNames`, so shared bases (`Spec`,
+        ``object``...) are only examined once.
+        """
+        key = id(cls)
+        if key not in self._available:
+            # Class attribute lookup falls back to the metaclass.
+            names = frozenset(dir(cls)) | frozenset(dir(type(cls)))
+            self._available[key] = (cls, names)
+        return self._available[key][1]
 
 
 # Plugin for loading selector & implementing some custom hooks too
 # (such as appending more test cases from gathered classes)
 class CustomSelector(nose.plugins.Plugin):
     name = "specselector"
+    # Where the addresses of last run's failing tests are kept
+    failed_filename = 'failed.json'
+
+    def options(self, parser, env=os.environ):
+        nose.plugins.Plugin.options(self, parser, env)
+        parser.add_option('--no-spec-cache', action='store_true',
+                          dest='no_spec_cache',
+                          default=env.get('NOSE_NO_SPEC_CACHE'),
+                          help="Don't record failing tests or durations "
+                          "under .spec_cache/ [NOSE_NO_SPEC_CACHE]")
+        parser.add_option('--changed', action='store_true',
+                          dest='spec_changed',
+                          help="Only run test modules which failed last time "
+                          "or which changed (along with any project modules "
+                          "they import) since they last passed")
+        parser.add_option('--spec-last-failed', action='store_true',
+                          dest='spec_last_failed',
+                          help="Only run the tests which failed or errored "
+                          "last time (or everything, if none did)")
+        parser.add_option('--spec-failed-first', action='store_true',
+                          dest='spec_failed_first',
+                          help="Run the tests which failed or errored last "
+                          "time before all the others")
 
     def configure(self, options, conf):
         nose.plugins.Plugin.configure(self, options, conf)
+        self.record_failed = self.enabled and not options.no_spec_cache
+        self.changed = None
+        if self.enabled and options.spec_changed:
+            self.changed = ChangedIndex()
+        self.preloaded = frozenset()
+        if self.enabled and (
+            options.spec_last_failed or options.spec_failed_first
+        ):
+            self.rerunFailed(conf, first=options.spec_failed_first)
+
+    def rerunFailed(self, conf, first):
+        """
+        Point nose at last run's failing tests, either instead of or before
+        its usual test names.
+
+        Explicitly named tests bypass selection, so when running them first
+        the selector just has to skip them during the full run.
+        """
+        failed = [
+            tuple(x) for x in cache.load(self.failed_filename, [])
+            if os.path.exists(x[0])
+        ]
+        if not failed:
+            return
+        names = [("%s:%s" % x) if x[1] else x[0] for x in failed]
+        if first:
+            names.extend(conf.testNames or ['.'])
+            self.preloaded = frozenset(failed)
+        conf.testNames = names
 
     def prepareTestLoader(self, loader):
-        loader.selector = SpecSelector(loader.config)
+        loader.selector = SpecSelector(
+            loader.config, changed=self.changed,
+            preloaded=self.preloaded,
+        )
         self.loader = loader
 
+    def finalize(self, result):
+        if self.record_failed:
+            self.recordFailed(result)
+        if self.changed is not None:
+            self.changed.update(
+                modules=self.loader.selector._valid_modules.values(),
+                failed=failed_files(result),
+            )
+
+    def recordFailed(self, result):
+        """
+        Update the stored addresses of failing tests with this run's outcome.
+
+        Entries for test files (or named tests) which ran are replaced by
+        this run's failures; those for anything else are kept, so partial
+        runs don't forget failures elsewhere.
+        """
+        files, calls = set(), set()
+        for module in self.loader.selector._valid_modules.values():
+            path = getattr(module, '__file__', None)
+            if path:
+                files.add(cache.source_file(path))
+        # Tests loaded by name bypass the selector.
+        for name in self.conf.testNames or ():
+            path, _, call = nose.util.split_test_name(name)
+            if path and os.path.isfile(path):
+                path = cache.source_file(path)
+                if call:
+                    calls.add((path, call))
+                else:
+                    files.add(path)
+
+        def ran(path, call):
+            if path in files:
+                return True
+            parts = (call or '').split('.')
+            return any(
+                (path, '.'.join(parts[:i])) in calls
+                for i in range(1, len(parts) + 1)
+            )
+
+        addresses = set(
+            tuple(x) for x in cache.load(self.failed_filename, [])
+            if os.path.exists(x[0]) and not ran(*x)
+        )
+        for test in failed_tests(result):
+            address = test_address(test)
+            if address and address[0]:
+                addresses.add((address[0], address[2]))
+        cache.save(self.failed_filename, sorted(addresses))
+
     def loadTestsFromTestClass(self, cls):
         """
         Manually examine test class for inner classes.
@@ -139,6 +322,29 @@ class CustomSelector(nose.plugins.Plugin):
         return results
 
 
+def failed_tests(result):
+    """
+    Return the tests in ``result`` which failed or errored.
+    """
+    failing = list(result.errors) + list(result.failures)
+    for storage, label, isfail in getattr(result, 'errorClasses', {}).values():
+        if isfail:
+            failing.extend(storage)
+    return [test for test, _ in failing]
+
+
+def failed_files(result):
+    """
+    Return the set of source files containing tests which failed or errored.
+    """
+    files = set()
+    for test in failed_tests(result):
+        address = test_address(test)
+        if address and address[0]:
+            files.add(address[0])
+    return files
+
+
 def args_contains(options):
     for opt in options:
         for arg in sys.argv[1:]:
@@ -166,7 +372,10 @@ def main():
         plugins = [CustomSelector()]
         if not args_contains(['--tests', '-w', '--where']):
             defaults.append("--where=tests")
-    nose.core.main(
-        argv=['nosetests'] + defaults + sys.argv[1:],
-        addplugins=plugins
-    )
+    argv = ['nosetests'] + defaults + sys.argv[1:]
+    if '--watch' in argv:
+        # Not a nose option: it wraps the whole (repeated) nose run.
+        from spec import watch
+        argv.remove('--watch')
+        return watch.main(argv, plugins)
+    nose.core.main(argv=argv, addplugins=plugins)
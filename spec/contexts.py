@@ -0,0 +1,207 @@
+"""
+Per-context state & per-test fixtures for `Spec` classes.
+
+A class (outer or inner) may define ``setup_context``: it runs once, on an
+instance of its own, before the first test in that class or any class nested
+within it. Whatever attributes it sets are then shared, as class attributes,
+by all of those tests -- for state too expensive to build per test, like a
+database schema or a loaded model. Once the run moves past the class (or its
+outermost class stops, as far as `SpecPlugin` is concerned; else at exit)
+``teardown_context`` runs on that same instance and the attributes go away.
+Contexts are torn down in reverse order of setup, innermost first.
+
+``@fixture`` methods, in turn, run before every test of their class, after
+its own ``setup``; see `fixture`.
+"""
+import atexit
+import sys
+from collections import OrderedDict
+from functools import wraps
+
+import six
+
+from spec import coroutines
+from spec.utils import class_members, hide
+
+
+# [class, context instance, names it added, exception] for each context set
+# up & not yet torn down, outermost first.
+_active = []
+
+
+def fixture(func):
+    """
+    Mark method ``func`` as a fixture, run before each test of its class.
+
+    Fixtures run after the class' ``setup``, in the order defined; setting
+    ``concurrent_fixtures = True`` on the class marks its ``async def``
+    fixtures as safe to run concurrently instead (after any plain ones.)
+    """
+    func._spec__fixture = True
+    return hide(func)
+
+
+def _mro(cls):
+    try:
+        return cls.__mro__
+    except AttributeError:
+        # Old-style (Python 2) class: depth-first, as inspect.getmro() does.
+        found = [cls]
+        for base in cls.__bases__:
+            found.extend(x for x in _mro(base) if x not in found)
+        return tuple(found)
+
+
+def _fixtures(cls):
+    """
+    Return ``cls``' fixtures, its bases' first.
+    """
+    found = OrderedDict()
+    for klass in reversed(_mro(cls)):
+        for name, value in six.iteritems(vars(klass)):
+            if getattr(value, '_spec__fixture', False):
+                found[name] = value
+    return list(found.values())
+
+
+def chain(cls):
+    """
+    Return ``cls`` and the classes it's nested in, outermost first.
+    """
+    classes = []
+    while cls is not None:
+        classes.insert(0, cls)
+        cls = vars(cls).get('_parent')
+    return classes
+
+
+def has_context(cls):
+    return callable(getattr(cls, 'setup_context', None))
+
+
+def enter(cls):
+    """
+    Make sure the contexts of ``cls`` (and those it's nested in) are set up,
+    tearing down those of classes the run has moved past first.
+    """
+    classes = chain(cls)
+    # Contexts nested within cls stay up: an inner class' tests set up their
+    # outer class, too.
+    while _active and _active[-1][0] not in classes \
+            and cls not in chain(_active[-1][0]):
+        _leave()
+    active = [entry[0] for entry in _active]
+    for klass in classes:
+        if klass in active:
+            error = _active[active.index(klass)][3]
+            if error is not None:
+                # Failed once already; don't pay for it again for each test.
+                six.reraise(*error)
+        elif has_context(klass):
+            _setup(klass)
+
+
+def _setup(cls):
+    instance = cls()
+    parent = vars(cls).get('_parent')
+    for entry in _active:
+        if entry[0] is parent:
+            # Context state only builds on outer context state, not on the
+            # outer class' per-test setup.
+            instance._parent_inst = entry[1]
+    before = set(vars(instance))
+    entry = [cls, instance, [], None]
+    _active.append(entry)
+    try:
+        instance.setup_context()
+    except Exception:
+        entry[3] = sys.exc_info()
+        raise
+    for name, value in six.iteritems(vars(instance)):
+        if name not in before:
+            setattr(cls, name, value)
+            entry[2].append(name)
+
+
+def _leave():
+    cls, instance, names, error = _active.pop()
+    try:
+        if error is None and callable(getattr(cls, 'teardown_context', None)):
+            instance.teardown_context()
+    finally:
+        for name in names:
+            if name in vars(cls):
+                delattr(cls, name)
+
+
+def leave_all():
+    while _active:
+        _leave()
+
+atexit.register(leave_all)
+
+
+def stop(context):
+    """
+    Tear down all contexts within ``context`` (a module or outermost class),
+    and close their event loops.
+    """
+    def within(cls):
+        if isinstance(context, six.class_types):
+            return chain(cls)[0] is context
+        return chain(cls)[0].__module__ == context.__name__
+    try:
+        while any(within(entry[0]) for entry in _active):
+            index = max(
+                i for i, entry in enumerate(_active) if within(entry[0])
+            )
+            # Anything set up after it is nested in it; goes first.
+            while len(_active) > index:
+                _leave()
+    finally:
+        coroutines.close_loops(context)
+
+
+def _setup_method(cls, fixtures, contexts):
+    setup = getattr(cls, 'setup', None)
+    # Don't wrap an inherited setup of ours again; just its original.
+    setup = getattr(setup, '_spec__setup', setup)
+
+    def run_setup(self):
+        if contexts:
+            enter(type(self))
+        if setup is not None:
+            setup(self)
+        if any(coroutines.is_coroutine_function(x) for x in fixtures):
+            coroutines.prepare(self)
+        concurrent = getattr(cls, 'concurrent_fixtures', False)
+        waiting = []
+        for func in fixtures:
+            if not coroutines.is_coroutine_function(func):
+                func(self)
+            elif concurrent:
+                waiting.append(func(self))
+            else:
+                coroutines.run(type(self), func(self))
+        if waiting:
+            coroutines.run_concurrently(type(self), waiting)
+    if setup is not None:
+        run_setup = wraps(setup)(run_setup)
+    run_setup.__name__ = 'setup'
+    run_setup._spec__setup = setup
+    return hide(run_setup)
+
+
+def prepare(cls):
+    """
+    Ready ``cls`` and its inner classes for running: make their coroutine
+    methods synchronous, and have their ``setup`` enter their contexts and run
+    their fixtures as needed.
+    """
+    coroutines.asyncify(cls)
+    fixtures = _fixtures(cls)
+    contexts = any(has_context(x) for x in chain(cls))
+    if fixtures or contexts:
+        setattr(cls, 'setup', _setup_method(cls, fixtures, contexts))
+    for name, inner in class_members(cls):
+        prepare(inner)
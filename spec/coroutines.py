@@ -0,0 +1,158 @@
+"""
+Support for ``async def`` tests & fixtures.
+
+Coroutine methods of `Spec` classes (including those of inner classes) are
+wrapped at class creation time (see `spec.contexts`) so that nose can call
+them like any other test. Each context -- class, or module for ``@trap``-ped
+functions -- gets its own event loop, created the first time one of its
+coroutines runs and reused by all of them until the context is done (closed by
+`SpecPlugin` once the context stops, else at interpreter exit.)
+
+Nothing here imports asyncio until a coroutine actually needs running, so
+suites without any pay nothing for it.
+"""
+import atexit
+import sys
+from functools import wraps
+
+import six
+
+from spec.utils import class_members, parent_instance
+
+
+# inspect.CO_COROUTINE, without importing inspect (or needing Python 3.5)
+CO_COROUTINE = 0x80
+
+# Fixture methods, which run on the loop like tests do.
+FIXTURES = (
+    'setup', 'teardown', 'setUp', 'tearDown',
+    'setup_context', 'teardown_context',
+)
+
+# Contexts with an open loop, for closing leftovers at exit.
+_contexts = []
+
+
+def is_coroutine_function(func):
+    code = getattr(func, '__code__', None)
+    return code is not None and bool(code.co_flags & CO_COROUTINE)
+
+
+def loop_for(context):
+    """
+    Return ``context``'s event loop, creating it if necessary.
+    """
+    loop = vars(context).get('_spec__loop')
+    if loop is None:
+        import asyncio
+        loop = asyncio.new_event_loop()
+        setattr(context, '_spec__loop', loop)
+        if not _contexts:
+            atexit.register(close_all)
+        _contexts.append(context)
+    return loop
+
+
+def run(context, coroutine):
+    """
+    Run ``coroutine`` to completion on ``context``'s loop; returns its result.
+    """
+    loop = loop_for(context)
+    import asyncio
+    # For code calling get_event_loop() outside of a coroutine.
+    asyncio.set_event_loop(loop)
+    return loop.run_until_complete(coroutine)
+
+
+def run_concurrently(context, coroutines):
+    """
+    Run ``coroutines`` together on ``context``'s loop; returns their results.
+    """
+    import asyncio
+    # gather() binds to the current loop, so switch to the context's first.
+    asyncio.set_event_loop(loop_for(context))
+    return run(context, asyncio.gather(*coroutines))
+
+
+def close_loop(context):
+    """
+    Close ``context``'s event loop, if it has one.
+    """
+    loop = vars(context).get('_spec__loop')
+    if loop is None:
+        return
+    delattr(context, '_spec__loop')
+    if context in _contexts:
+        _contexts.remove(context)
+    if not loop.is_closed():
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def close_all():
+    for context in list(_contexts):
+        close_loop(context)
+
+
+def close_loops(context):
+    """
+    Close the loops of ``context`` and, for a class, its inner classes.
+    """
+    close_loop(context)
+    if isinstance(context, six.class_types):
+        for name, inner in class_members(context):
+            close_loops(inner)
+
+
+def context_of(func, args):
+    """
+    Guess the context ``func`` is being called in, given its ``args``.
+
+    The class of ``args[0]`` if that has ``func`` as a method, else the module
+    ``func`` is defined in.
+    """
+    if args and getattr(type(args[0]), func.__name__, None) is not None:
+        return type(args[0])
+    return sys.modules[func.__module__]
+
+
+def prepare(instance):
+    """
+    Set up inner class ``instance``'s parent ahead of running a coroutine.
+
+    Otherwise the first parent attribute looked up from within the coroutine
+    would run the parent's setup -- which may itself need the loop, then
+    already busy -- in the middle of it.
+    """
+    if getattr(type(instance), '_parent', None) is not None:
+        parent_instance(instance)
+
+
+def synchronous(func):
+    """
+    Wrap coroutine function ``func`` into one running it on its context's
+    loop.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        context = context_of(func, args)
+        if context is not sys.modules.get(func.__module__):
+            prepare(args[0])
+        return run(context, func(*args, **kwargs))
+    return wrapper
+
+
+def asyncify(cls):
+    """
+    Make ``cls``' coroutine tests & setup/teardown methods synchronous.
+
+    Private coroutine methods are left alone: they're helpers for tests to
+    await, not tests.
+    """
+    for name, value in list(vars(cls).items()):
+        if not is_coroutine_function(value):
+            continue
+        if name in FIXTURES or not (
+            name.startswith('_') or getattr(value, '_spec__is_private', False)
+        ):
+            setattr(cls, name, synchronous(value))
@@ -0,0 +1,429 @@
+"""
+``spec --daemon``: keep imports warm, forking a fresh child per run.
+
+The daemon imports nose, spec's plugins (and nose's plugin discovery) plus any
+``--preload`` modules -- typically your app's heaviest dependencies -- once,
+then listens on a Unix socket, kept in a directory only the current user can
+access (see `socket_path`). From then on, plain ``spec`` invocations in the
+directory it was started in connect to it instead of starting from scratch:
+each is handed to a child forked from the warm daemon (so it inherits all of
+its imports, copy-on-write) which runs the usual discovery & tests with the
+client's arguments, directory and environment. The child's stdout & stderr are
+streamed back to the client as they're written, followed by its exit status.
+
+Test & project modules aren't preloaded, so edits are always picked up. When
+a preloaded module from the project itself changes, though, the daemon
+restarts itself (that client falls back to running on its own.) ``spec
+--no-daemon`` always runs locally.
+
+As clients send their whole environment along, they only talk to sockets they
+own, and the daemon hangs up on clients run by other users.
+
+This module is the ``spec`` command's entry point; the client side of it only
+uses the standard library, leaving nose & co to the daemon.
+"""
+from __future__ import print_function
+
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+
+
+# Each message is a one byte kind, the payload's length and the payload:
+# REQUEST (client to daemon), STDOUT, STDERR & STATUS (daemon to client.)
+FRAME = struct.Struct('!cI')
+REQUEST = b'r'
+STDOUT = b'1'
+STDERR = b'2'
+STATUS = b'x'
+
+# Imported up front by every daemon, on top of any --preload modules.
+PRELOAD = ('nose', 'spec.plugin', 'spec.cli', 'pkg_resources')
+
+
+def runtime_dir(env=os.environ):
+    """
+    Return the per-user directory daemon sockets live in by default:
+    ``$XDG_RUNTIME_DIR/spec``, else ``spec-<uid>`` in the temp directory.
+    """
+    if env.get('XDG_RUNTIME_DIR'):
+        return os.path.join(env['XDG_RUNTIME_DIR'], 'spec')
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), 'spec-%d' % os.getuid())
+
+
+def socket_path(env=os.environ, directory=None):
+    """
+    Return where the daemon for ``directory`` (the current one by default)
+    listens.
+
+    That's a socket in `runtime_dir` named after the directory's
+    ``.spec_cache`` (see `spec.cache`), unless ``NOSE_SPEC_DAEMON_SOCKET`` says
+    otherwise.
+    """
+    if env.get('NOSE_SPEC_DAEMON_SOCKET'):
+        return env['NOSE_SPEC_DAEMON_SOCKET']
+    import hashlib
+    project = os.path.join(
+        directory or os.getcwd(),
+        env.get('NOSE_SPEC_CACHE_DIR') or '.spec_cache',
+    )
+    digest = hashlib.sha1(project.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(runtime_dir(env), "%s.sock" % digest)
+
+
+def is_own_socket(path):
+    """
+    Is ``path`` a socket owned by the current user?
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid()
+
+
+def send(sock, kind, payload):
+    sock.sendall(FRAME.pack(kind, len(payload)) + payload)
+
+
+def receive(sock):
+    """
+    Return the next ``(kind, payload)`` from ``sock``, or None at its end.
+    """
+    header = _read(sock, FRAME.size)
+    if header is None:
+        return None
+    kind, length = FRAME.unpack(header)
+    payload = _read(sock, length)
+    if payload is None:
+        return None
+    return kind, payload
+
+
+def _read(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 64 * 1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+################################################################################
+## Client
+################################################################################
+
+def run_client(path, args):
+    """
+    Have the daemon at ``path`` run spec with ``args``, echoing its output.
+
+    Returns the run's exit status, or None if there's no daemon to talk to
+    (or it went away before doing anything.) Sockets not owned by the current
+    user are never talked to.
+    """
+    if not is_own_socket(path):
+        print("spec: ignoring %s, which isn't a socket of yours" % path,
+              file=sys.stderr)
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        request = {
+            'args': args,
+            'cwd': os.getcwd(),
+            'env': dict(os.environ),
+            'tty': [sys.stdout.isatty(), sys.stderr.isatty()],
+        }
+        send(sock, REQUEST, json.dumps(request).encode('utf-8'))
+    except socket.error:
+        sock.close()
+        return None
+    streams = {
+        STDOUT: getattr(sys.stdout, 'buffer', sys.stdout),
+        STDERR: getattr(sys.stderr, 'buffer', sys.stderr),
+    }
+    started = False
+    try:
+        while True:
+            message = receive(sock)
+            if message is None:
+                if not started:
+                    return None
+                print("spec: lost the daemon mid-run", file=sys.stderr)
+                return 1
+            kind, payload = message
+            if kind == STATUS:
+                return int(payload)
+            started = True
+            streams[kind].write(payload)
+            streams[kind].flush()
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        sock.close()
+
+
+################################################################################
+## Daemon
+################################################################################
+
+class SocketStream(object):
+    """
+    Stand-in for a child's ``sys.stdout``/``sys.stderr``, sending writes to
+    the client as they happen.
+    """
+    encoding = 'utf-8'
+
+    def __init__(self, sock, kind, tty=False):
+        self.sock = sock
+        self.kind = kind
+        self.tty = tty
+
+    def write(self, s):
+        if not isinstance(s, bytes):
+            s = s.encode('utf-8')
+        if s:
+            send(self.sock, self.kind, s)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self.tty
+
+    # For code writing bytes to sys.stdout.buffer.
+    @property
+    def buffer(self):
+        return self
+
+
+def exit_status(code):
+    """
+    Turn a `SystemExit` code into a process exit status, as Python would.
+    """
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        # Including bools, as in sys.exit(not success)
+        return int(code)
+    print(code, file=sys.stderr)
+    return 1
+
+
+def handle(sock):
+    """
+    Serve one client request on ``sock``, in a freshly forked child.
+    """
+    message = receive(sock)
+    if message is None or message[0] != REQUEST:
+        return
+    request = json.loads(message[1].decode('utf-8'))
+    os.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+    from spec import cache
+    cache.launch_dir = os.getcwd()
+    sys.stdout = SocketStream(sock, STDOUT, request['tty'][0])
+    sys.stderr = SocketStream(sock, STDERR, request['tty'][1])
+    sys.argv = ['spec'] + request['args']
+    status = 0
+    try:
+        from spec.cli import main
+        main()
+    except SystemExit as e:
+        status = exit_status(e.code)
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        status = 1
+    send(sock, STATUS, str(status).encode('ascii'))
+
+
+def peer_uid(sock):
+    """
+    Return the user id of the process at the other end of Unix socket
+    ``sock``, or None where the platform can't tell.
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = struct.Struct('3i')
+    pid, uid, gid = creds.unpack(
+        sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, creds.size)
+    )
+    return uid
+
+
+def is_listening(path):
+    """
+    Is a daemon accepting connections at ``path``?
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+class Daemon(object):
+    """
+    Preloads ``modules``, then forks a child per client connecting to
+    ``path``.
+    """
+    def __init__(self, path, modules=()):
+        self.path = path
+        self.modules = list(PRELOAD) + list(modules)
+        self.stamps = {}
+        self.children = set()
+
+    def preload(self):
+        import importlib
+        for name in self.modules:
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                if name not in PRELOAD:
+                    print("spec daemon: can't preload %s: %s" % (name, e),
+                          file=sys.stderr)
+        # nose looks its plugins up anew for every run; do the import-heavy
+        # part (pkg_resources scanning entry points) now.
+        import nose
+        nose.plugins.manager.DefaultPluginManager().loadPlugins()
+        from spec import cache
+        from spec.changed import install_dirs, is_project_file
+        installed = install_dirs()
+        for module in list(sys.modules.values()):
+            path = getattr(module, '__file__', None)
+            if path:
+                path = cache.source_file(path)
+                if is_project_file(path, installed) and os.path.exists(path):
+                    self.stamps[path] = cache.stamp(path)
+
+    def stale(self):
+        """
+        Has a preloaded project module changed since the daemon started?
+        """
+        from spec import cache
+        return not all(
+            cache.is_fresh(path, old) for path, old in self.stamps.items()
+        )
+
+    def reap(self):
+        for pid in list(self.children):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except OSError:
+                done = pid
+            if done:
+                self.children.discard(pid)
+
+    def listen(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        if directory == runtime_dir():
+            # Its name is predictable; make sure nobody else set it up.
+            st = os.lstat(directory)
+            if (
+                not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid()
+                or st.st_mode & 0o077
+            ):
+                raise SystemExit(
+                    "spec: %s must be a directory only you can access"
+                    % directory
+                )
+        if os.path.exists(self.path):
+            # Left behind by a daemon that died, unless one's still there.
+            if is_listening(self.path):
+                raise SystemExit(
+                    "spec: a daemon is already listening on %s" % self.path
+                )
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Owner only from the start, wherever the socket ends up.
+        umask = os.umask(0o177)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        os.chmod(self.path, 0o600)
+        sock.listen(16)
+        return sock
+
+    def serve(self):
+        import signal
+        self.preload()
+        sock = self.listen()
+        # Clean up the socket when terminated, too.
+        terminate = signal.signal(
+            signal.SIGTERM, lambda signum, frame: sys.exit(0),
+        )
+        print("spec daemon listening on %s (Ctrl-C to stop)" % self.path,
+              file=sys.stderr)
+        restart = False
+        try:
+            while True:
+                conn, _ = sock.accept()
+                if peer_uid(conn) not in (None, os.getuid()):
+                    conn.close()
+                    continue
+                self.reap()
+                if self.stale():
+                    conn.close()
+                    restart = True
+                    break
+                pid = os.fork()
+                if pid == 0:
+                    signal.signal(signal.SIGTERM, terminate)
+                    sock.close()
+                    try:
+                        handle(conn)
+                    finally:
+                        os._exit(0)
+                self.children.add(pid)
+                conn.close()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sock.close()
+            os.unlink(self.path)
+        if restart:
+            print("spec daemon: preloaded modules changed, restarting",
+                  file=sys.stderr)
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def main():
+    args = sys.argv[1:]
+    if '--daemon' in args:
+        modules = []
+        for arg in args:
+            if arg.startswith('--preload='):
+                modules.extend(x for x in arg[10:].split(',') if x)
+        modules.extend(
+            x for x in os.environ.get('NOSE_SPEC_PRELOAD', '').split(',') if x
+        )
+        Daemon(socket_path(), modules).serve()
+        return
+    if '--no-daemon' in args:
+        sys.argv.remove('--no-daemon')
+    elif hasattr(socket, 'AF_UNIX') and hasattr(os, 'fork'):
+        path = socket_path()
+        if os.path.exists(path):
+            status = run_client(path, args)
+            if status is not None:
+                sys.exit(status)
+    from spec.cli import main
+    main()
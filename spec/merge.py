@@ -0,0 +1,120 @@
+"""
+Merge the ``--spec-jsonl`` results of several shards into a single report.
+
+Prints the combined spec tree (contexts in the order first seen, grouped by
+source file), the tracebacks of failing tests, and one overall summary. Exits
+non-zero if any test failed or errored.
+
+Usage: spec-merge RESULTS.jsonl [RESULTS.jsonl ...]
+"""
+from __future__ import print_function
+
+import json
+import sys
+from collections import OrderedDict
+
+import six
+
+
+FAILING = ('failure', 'error')
+# How non-passing statuses are marked in the merged tree & summary.
+MARKERS = OrderedDict([
+    ('failure', 'failures'),
+    ('error', 'errors'),
+    ('skipped', 'skipped'),
+    ('deprecated', 'deprecated'),
+])
+
+
+def load(paths):
+    """
+    Return the records from each of the JSON Lines files at ``paths``.
+    """
+    records = []
+    for path in paths:
+        with open(path) as fd:
+            for line in fd:
+                if line.strip():
+                    records.append(json.loads(line))
+    return records
+
+
+def summarize(records):
+    """
+    Return a dict summarizing ``records``: total ``tests``, per-status
+    ``counts``, summed test ``duration`` and whether it was ``successful``.
+    """
+    counts = dict((status, 0) for status in ['ok'] + list(MARKERS))
+    duration = 0.0
+    for record in records:
+        counts[record['status']] = counts.get(record['status'], 0) + 1
+        duration += record['duration'] or 0
+    return {
+        'tests': len(records),
+        'counts': counts,
+        'duration': duration,
+        'successful': not any(counts[x] for x in FAILING),
+    }
+
+
+def render(records, stream=sys.stdout):
+    groups = OrderedDict()
+    for record in records:
+        key = (record['file'] or '', tuple(record['contexts']))
+        groups.setdefault(key, []).append(record)
+    printed = set()
+    # Stable sort: files in path order, contexts within in first-seen order.
+    for (path, contexts), items in sorted(
+        groups.items(), key=lambda x: x[0][0],
+    ):
+        for depth in range(len(contexts)):
+            if (path, contexts[:depth + 1]) not in printed:
+                printed.add((path, contexts[:depth + 1]))
+                print("\n%s%s" % ("    " * depth, contexts[depth]),
+                      file=stream)
+        indent = "    " * max(len(contexts) - 1, 0)
+        for record in items:
+            status = record['status']
+            mark = "" if status == 'ok' else " (%s)" % status
+            print("%s- %s%s" % (indent, record['description'], mark),
+                  file=stream)
+    print("", file=stream)
+    for record in records:
+        if record['status'] not in FAILING:
+            continue
+        print("=" * 70, file=stream)
+        print("%s: %s" % (
+            "FAIL" if record['status'] == 'failure' else "ERROR",
+            "%s - %s" % (" ".join(record['contexts']), record['description']),
+        ), file=stream)
+        print("-" * 70, file=stream)
+        print(record['traceback'] or "", file=stream)
+    summary = summarize(records)
+    num = summary['tests']
+    print("Ran %s test%s (%.3f seconds of test time)" % (
+        num, "s" if num != 1 else "", summary['duration'],
+    ), file=stream)
+    counts = summary['counts']
+    if summary['successful']:
+        skipped = counts['skipped']
+        print("OK" + (" (%i skipped)" % skipped if skipped else ""),
+              file=stream)
+    else:
+        print("FAILED (%s)" % ", ".join(
+            "%s=%s" % (label, counts[status])
+            for status, label in six.iteritems(MARKERS)
+        ), file=stream)
+    return summary
+
+
+def main(argv=None):
+    paths = sys.argv[1:] if argv is None else argv
+    if not paths:
+        print(__doc__.strip().splitlines()[-1], file=sys.stderr)
+        sys.exit(2)
+    summary = render(load(paths))
+    sys.exit(0 if summary['successful'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,14 @@
 import doctest
+import heapq
+import inspect
+import io
+import json
 import os
 import re
 import types
 import time
 import unittest
+import weakref
 from functools import partial
 # Python 2.7: _WritelnDecorator moved.
 try:
@@ -13,6 +18,7 @@ except ImportError:
 
 import six
 from six import StringIO as IO
+from six.moves import reprlib
 import nose
 from nose.plugins import Plugin
 # Python 2.7: nose uses unittest's builtin SkipTest class
@@ -25,6 +31,9 @@ except AttributeError:
 # python2 vs python3 issues.
 from nose.plugins.xunit import format_exception
 
+from spec import contexts, schedule, workers
+from spec.cache import test_address
+
 ################################################################################
 ## Functions for constructing specifications based on nose testing objects.
 ################################################################################
@@ -35,6 +44,45 @@ def dispatch_on_type(dispatch_table, instance):
             return func(instance)
 
 
+class TypeDispatcher(object):
+    """
+    Like `dispatch_on_type`, but looks handlers up by type instead of scanning.
+
+    Each concrete type's handler is found once -- first by walking its MRO
+    for an exact entry, then by falling back to `dispatch_on_type`'s in-order
+    ``isinstance`` checks -- and remembered from then on.
+    """
+    def __init__(self, dispatch_table):
+        self.dispatch_table = dispatch_table
+        self.handlers = dict(
+            (type, func) for type, func in dispatch_table if type is not True
+        )
+        self._resolved = {}
+
+    def resolve(self, cls):
+        try:
+            return self._resolved[cls]
+        except KeyError:
+            pass
+        handler = None
+        for klass in inspect.getmro(cls):
+            if klass in self.handlers:
+                handler = self.handlers[klass]
+                break
+        else:
+            for type, func in self.dispatch_table:
+                if type is True or issubclass(cls, type):
+                    handler = func
+                    break
+        self._resolved[cls] = handler
+        return handler
+
+    def __call__(self, instance):
+        handler = self.resolve(instance.__class__)
+        if handler is not None:
+            return handler(instance)
+
+
 def remove_leading(needle, haystack):
     """Remove leading needle string (if exists).
 
@@ -65,6 +113,13 @@ def remove_leading_and_trailing(needle, haystack):
     return remove_leading(needle, remove_trailing(needle, haystack))
 
 
+CAPITAL = re.compile(r'([A-Z])')
+
+
+def _wordize(match):
+    return ' ' + match.group(1).lower()
+
+
 def camel2word(string):
     """Covert name from CamelCase to "Normal case".
 
@@ -73,10 +128,16 @@ def camel2word(string):
     >>> camel2word('CaseWithSpec')
     'Case with spec'
     """
-    def wordize(match):
-        return ' ' + match.group(1).lower()
+    return string[0] + CAPITAL.sub(_wordize, string[1:])
+
 
-    return string[0] + re.sub(r'([A-Z])', wordize, string[1:])
+CONTRACTIONS = {
+    "dont": "don't",
+    "doesnt": "doesn't",
+    "wont": "won't",
+    "wasnt": "wasn't",
+}
+CONTRACTION = re.compile('|'.join(CONTRACTIONS))
 
 
 def complete_english(string):
@@ -86,12 +147,9 @@ def complete_english(string):
     >>> complete_english('doesnt is matched as well')
     "doesn't is matched as well"
     """
-    for x, y in [("dont", "don't"),
-                ("doesnt", "doesn't"),
-                ("wont", "won't"),
-                ("wasnt", "wasn't")]:
-        string = string.replace(x, y)
-    return string
+    if 'nt' not in string:
+        return string
+    return CONTRACTION.sub(lambda match: CONTRACTIONS[match.group(0)], string)
 
 
 def underscore2word(string):
@@ -107,10 +165,37 @@ def argumentsof(test):
     return ""
 
 
+def memoize(func):
+    """
+    Cache ``func``'s result per (hashable) argument.
+
+    Used for the name-to-spec conversions: names repeat a lot across a suite
+    (think generators, or inherited test methods) and are cheap to key on.
+    """
+    results = {}
+
+    def memoized(name):
+        try:
+            return results[name]
+        except KeyError:
+            result = results[name] = func(name)
+            return result
+    memoized.__name__ = func.__name__
+    memoized.__doc__ = func.__doc__
+    memoized.cache = results
+    return memoized
+
+
+@memoize
 def underscored2spec(name):
-    return complete_english(underscore2word(remove_trailing('_test', remove_leading('test_', name))))
+    if name[:5] == 'test_':
+        name = name[5:]
+    if name[-5:] == '_test':
+        name = name[:-5]
+    return complete_english(name.replace('_', ' '))
 
 
+@memoize
 def camelcase2spec(name):
     return camel2word(
         remove_trailing('_',
@@ -142,12 +227,45 @@ def unittestMethodDescription(test):
         return "".join([text.strip() for text in description])
 
 
-def noseFunctionDescription(test):
+# Longest rendering of a generated test's argument in a bounded description
+# (i.e. with --spec-generators=collapse.)
+ARG_LIMIT = 80
+# Containers are rendered (like str() would) only as far as needed. Element
+# counts & nesting are only capped beyond what could fit in ARG_LIMIT.
+_arg_repr = reprlib.Repr()
+for _name in (
+    'maxstring', 'maxother', 'maxlist', 'maxtuple', 'maxset', 'maxfrozenset',
+    'maxdict', 'maxdeque', 'maxarray', 'maxlevel',
+):
+    setattr(_arg_repr, _name, ARG_LIMIT)
+del _name
+
+
+def shorten(text, limit):
+    if len(text) > limit:
+        text = text[:limit - 3] + "..."
+    return text
+
+
+def argDescription(arg, bounded=False):
+    if not bounded:
+        return six.text_type(arg)
+    if isinstance(arg, (list, tuple, dict, set, frozenset)):
+        text = _arg_repr.repr(arg)
+        if len(text) > ARG_LIMIT:
+            return shorten(text, ARG_LIMIT)
+        # Small enough to render in full, exactly as str() does.
+    return shorten(six.text_type(arg), ARG_LIMIT)
+
+
+def noseFunctionDescription(test, bounded=False):
     # Special case for test generators.
     if test.descriptor is not None:
         if hasattr(test.test, 'description'):
             return test.test.description
-        return "holds for %s" % ', '.join(map(six.text_type, test.arg))
+        return "holds for %s" % ', '.join(
+            argDescription(arg, bounded) for arg in test.arg
+        )
     return test.test.__doc__ or underscored2spec(test.test.__name__)
 
 
@@ -168,31 +286,104 @@ def doctestExamplesDescription(test):
             yield "%s %s" % (source.strip(), want.strip())
 
 
-def testDescription(test):
-    supported_test_types = [
-        (nose.case.MethodTestCase, noseMethodDescription),
-        (nose.case.FunctionTestCase, noseFunctionDescription),
-        (doctest.DocTestCase, doctestExamplesDescription),
-        (unittest.TestCase, unittestMethodDescription),
+describe_test = TypeDispatcher([
+    (nose.case.MethodTestCase, noseMethodDescription),
+    (nose.case.FunctionTestCase, noseFunctionDescription),
+    (doctest.DocTestCase, doctestExamplesDescription),
+    (unittest.TestCase, unittestMethodDescription),
+])
+
+
+def testDescription(test, bounded=False):
+    """
+    Describe ``test``; if ``bounded``, generated tests' arguments are cut
+    down to `ARG_LIMIT` characters each.
+    """
+    if bounded and isinstance(test.test, nose.case.FunctionTestCase):
+        return noseFunctionDescription(test.test, bounded)
+    return describe_test(test.test)
+
+
+supported_context_types = [
+    (types.ModuleType, underscoredDescription),
+    (types.FunctionType, underscoredDescription),
+    (doctest.DocTestCase, doctestContextDescription),
+    (type, camelcaseDescription),
+]
+if not six.PY3:
+    supported_context_types += [
+        # Handle both old and new style classes.
+        (types.ClassType, camelcaseDescription),
     ]
-    return dispatch_on_type(supported_test_types, test.test)
+describe_context = TypeDispatcher(supported_context_types)
+# Descriptions of modules, classes & functions, keyed by id(). Values hold a
+# weak reference to their object, checked on lookup so an id reused by some
+# later object can't pick up a stale description; entries go away along with
+# their objects. (Other contexts, i.e. doctests, aren't long-lived enough to
+# be worth keeping around.)
+_context_descriptions = {}
+_memoized_contexts = tuple(
+    x for x in (types.ModuleType, types.FunctionType, type,
+                getattr(types, 'ClassType', None)) if x is not None
+)
 
 
 def contextDescription(context):
-    supported_context_types = [
-        (types.ModuleType, underscoredDescription),
-        (types.FunctionType, underscoredDescription),
-        (doctest.DocTestCase, doctestContextDescription),
-        (type, camelcaseDescription),
-    ]
+    entry = _context_descriptions.get(id(context))
+    if entry is not None and entry[0]() is context:
+        return entry[1]
+    description = describe_context(context)
+    if isinstance(context, _memoized_contexts):
+        key = id(context)
+        try:
+            ref = weakref.ref(context, partial(_forgetContext, key))
+        except TypeError:
+            # Python 2's modules can't be weakly referenced.
+            return description
+        _context_descriptions[key] = (ref, description)
+    return description
+
+
+def _forgetContext(key, ref):
+    # Only if the entry is still this (now dead) object's.
+    entry = _context_descriptions.get(key)
+    if entry is not None and entry[0] is ref:
+        del _context_descriptions[key]
+
+
+def forgetContexts(modules):
+    """
+    Drop memoized descriptions of the named ``modules`` and their classes &
+    functions, e.g. before those modules get reloaded.
+    """
+    for key, (ref, _) in list(_context_descriptions.items()):
+        context = ref()
+        if context is None:
+            continue
+        if isinstance(context, types.ModuleType):
+            name = context.__name__
+        else:
+            name = getattr(context, '__module__', None)
+        if name in modules:
+            del _context_descriptions[key]
 
-    if not six.PY3:
-        supported_context_types += [
-            # Handle both old and new style classes.
-            (types.ClassType, camelcaseDescription),
-        ]
 
-    return dispatch_on_type(supported_context_types, context)
+def generatorOf(test):
+    """
+    Return the test generator ``test`` was yielded by, or None.
+    """
+    case = getattr(test, 'test', None)
+    if isinstance(case, nose.case.FunctionTestCase):
+        return case.descriptor
+    if isinstance(case, nose.case.MethodTestCase):
+        if case.descriptor is not None:
+            return case.descriptor
+        # Inline functions yielded by generator methods run with the
+        # generator -- bound, unlike regular test methods -- as their method.
+        method = case.method
+        if inspect.ismethod(method) and method.__self__ is not None:
+            return method
+    return None
 
 
 def testContext(test):
@@ -211,11 +402,81 @@ def testContext(test):
 ## Output stream that can be easily enabled and disabled.
 ################################################################################
 
+class NullStream(object):
+    """
+    Stream discarding everything written to it, without any system calls.
+    """
+    def write(self, text):
+        pass
+
+    def writelines(self, lines):
+        pass
+
+    def flush(self):
+        pass
+
+    def reset(self):
+        pass
+
+    def getvalue(self):
+        return ""
+
+
+class CaptureBuffer(object):
+    """
+    Reusable in-memory stream holding at most ``limit`` characters per use.
+
+    Anything written past the limit is discarded and counted in ``dropped``.
+    `reset` empties the buffer for its next use.
+    """
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.buffer = IO()
+        self.size = 0
+        self.dropped = 0
+
+    def reset(self):
+        self.buffer.seek(0)
+        self.buffer.truncate(0)
+        self.size = 0
+        self.dropped = 0
+
+    def write(self, text):
+        if self.limit is not None and self.size + len(text) > self.limit:
+            room = max(self.limit - self.size, 0)
+            self.dropped += len(text) - room
+            text = text[:room]
+            if not text:
+                return
+        self.buffer.write(text)
+        self.size += len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return self.buffer.getvalue()
+
+
 class OutputStream(_WritelnDecorator):
-    def __init__(self, on_stream, off_stream):
-        self.capture_stream = IO()
+    """
+    Stream switching between printing (``on``), discarding (``off``) and
+    capturing output.
+
+    Captured output is kept until the next `capture` call, up to
+    ``capture_limit`` characters (no limit if None, nothing at all if 0.)
+    """
+    def __init__(self, on_stream, off_stream=None, capture_limit=None):
+        if capture_limit == 0:
+            self.capture_stream = NullStream()
+        else:
+            self.capture_stream = CaptureBuffer(capture_limit)
         self.on_stream = on_stream
-        self.off_stream = off_stream
+        self.off_stream = NullStream() if off_stream is None else off_stream
         self.stream = on_stream
 
     def on(self):
@@ -225,12 +486,11 @@ class OutputStream(_WritelnDecorator):
         self.stream = self.off_stream
 
     def capture(self):
-        self.capture_stream.truncate()
+        self.capture_stream.reset()
         self.stream = self.capture_stream
 
     def get_captured(self):
-        self.capture_stream.seek(0)
-        return self.capture_stream.read()
+        return self.capture_stream.getvalue()
 
 
 def depth(context):
@@ -242,40 +502,104 @@ def depth(context):
 
 
 class SpecOutputStream(OutputStream):
+    """
+    Spec output, optionally buffered.
+
+    When ``buffered``, rendered text is gathered up and written out in one go
+    at each context boundary, or sooner once ``buffer_size`` characters are
+    pending or the oldest pending text is ``buffer_delay`` seconds old
+    (checked as text comes in.) Call `flush_pending` before writing to the
+    underlying stream directly.
+    """
+    buffer_size = 64 * 1024
+    buffer_delay = 0.5
+
+    def __init__(self, on_stream, off_stream=None, buffered=False,
+                 capture_limit=None):
+        OutputStream.__init__(self, on_stream, off_stream, capture_limit)
+        self.buffered = buffered
+        self._pending = []
+        self._pending_size = 0
+        self._pending_since = None
+        self._depth = 0
+        self._indent = ""
+        # Nesting depth of each context printed so far, keyed by id()
+        self._depths = {}
+        # Contexts printed so far, keyed by id()
+        self._printed = {}
+
     def print_text(self, text):
-        self.on()
-        self.write(text)
+        if not self.buffered:
+            self.on()
+            self.write(text)
+            self.off()
+            return
+        # Same end state as an unbuffered write.
         self.off()
+        if not self._pending:
+            self._pending_since = time.time()
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if (
+            self._pending_size >= self.buffer_size
+            or time.time() - self._pending_since >= self.buffer_delay
+        ):
+            self.flush_pending()
+
+    def discard_pending(self):
+        """
+        Forget any buffered text, returning it.
+        """
+        text = "".join(self._pending)
+        self._pending = []
+        self._pending_size = 0
+        return text
+
+    def flush_pending(self):
+        if not self._pending:
+            return
+        self.on_stream.write(self.discard_pending())
+        if hasattr(self.on_stream, 'flush'):
+            self.on_stream.flush()
 
     def print_line(self, line=''):
         self.print_text(line + "\n")
 
-    @property
-    def _indent(self):
-        return "    " * self._depth
+    def context_depth(self, context):
+        try:
+            return self._depths[id(context)][1]
+        except KeyError:
+            level = depth(context)
+            self._depths[id(context)] = (context, level)
+            return level
 
     def print_context(self, context):
+        if self.buffered:
+            self.flush_pending()
         # Ensure parents get printed too (e.g. an outer class with nothing but
         # inner classes will otherwise never get printed.)
         if (
             hasattr(context, '_parent')
-            and not getattr(context._parent, '_printed', False)
+            and id(context._parent) not in self._printed
         ):
             self.print_context(context._parent)
         # Adjust indentation depth
-        self._depth = depth(context)
-        self.print_line("\n%s%s" % (self._indent, contextDescription(context)))
-        context._printed = True
-
-    def print_spec(self, color_func, test, status=None):
-        spec = testDescription(test)
+        self._depth = self.context_depth(context)
+        self._indent = "    " * self._depth
+        self.print_text(
+            "\n%s%s\n" % (self._indent, contextDescription(context))
+        )
+        self._printed[id(context)] = context
+
+    def print_spec(self, color_func, test, status=None, bounded=False):
+        spec = testDescription(test, bounded)
         if not isinstance(spec, types.GeneratorType):
             spec = [spec.strip()]
+        paren = (" (%s)" % status) if status else ""
         for s in spec:
-            name = "- %s" % s
-            paren = (" (%s)" % status) if status else ""
-            indent = getattr(self, '_indent', "")
-            self.print_line(indent + color_func(name) + paren)
+            self.print_text(
+                "%s%s%s\n" % (self._indent, color_func("- " + s), paren)
+            )
 
 
 
@@ -293,10 +617,47 @@ colors = dict(
     blue="34"
 )
 
+# Location lines of formatted tracebacks
+TRACEBACK_FILE = re.compile(r'  File "(.*)", line (\d*)(?:, in (.*))?$')
+
+
 def colorize(color, text, bold=False):
     bold = 1 if bold else 0
     return "\x1b[%s;%sm%s%s" % (bold, colors[color], text, color_end)
 
+################################################################################
+## Result records.
+################################################################################
+
+class TestRecord(object):
+    """
+    What's kept of a failed or erroring test once it's finished.
+
+    ``id`` is its label in traceback headers, ``context`` an index into the
+    plugin's table of context descriptions, ``duration`` is in seconds (or
+    ``None``) and ``message`` the formatted, size-limited traceback lines.
+    """
+    __slots__ = (
+        'id', 'description', 'context', 'status', 'duration', 'message',
+    )
+
+    def __init__(self, id, description, context, status, duration, message):
+        self.id = id
+        self.description = description
+        self.context = context
+        self.status = status
+        self.duration = duration
+        self.message = message
+
+    # Slotted classes need these to pickle (for --spec-workers) everywhere.
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
 ################################################################################
 ## Plugin itself.
 ################################################################################
@@ -308,8 +669,13 @@ class SpecPlugin(Plugin):
 
     def __init__(self, *args, **kwargs):
         super(SpecPlugin, self).__init__(*args, **kwargs)
+        # TestRecords of failed & erroring tests, plus the context
+        # descriptions they index into.
         self._failures = []
         self._errors = []
+        self._contexts = []
+        self._context_indices = {}
+        self._started = None
         self.color = {}
 
     def options(self, parser, env=os.environ):
@@ -334,6 +700,103 @@ class SpecPlugin(Plugin):
                           type=float,
                           default=0.1,
                           help="Number (float) of seconds above which to display test runtime. Default: 0.1")
+        parser.add_option('--spec-workers',
+                          metavar="N",
+                          type=int,
+                          default=int(env.get('NOSE_SPEC_WORKERS') or 0),
+                          help="Run test modules across N worker processes. "
+                          "Default: 0 (run serially) [NOSE_SPEC_WORKERS]")
+        parser.add_option('--spec-slowest',
+                          metavar="N",
+                          type=int,
+                          default=int(env.get('NOSE_SPEC_SLOWEST') or 0),
+                          help="After the run, list the N slowest tests and "
+                          "contexts (modules & classes, including their "
+                          "setup/teardown time) [NOSE_SPEC_SLOWEST]")
+        parser.add_option('--spec-jsonl',
+                          metavar="PATH",
+                          default=env.get('NOSE_SPEC_JSONL'),
+                          help="Write one JSON object per finished test to "
+                          "PATH, as the run progresses [NOSE_SPEC_JSONL]")
+        parser.add_option('--spec-capture-limit',
+                          metavar="CHARS",
+                          type=int,
+                          default=int(
+                              env.get('NOSE_SPEC_CAPTURE_LIMIT') or 64 * 1024
+                          ),
+                          help="Keep at most this much of the runner output "
+                          "written after each test; 0 discards it outright. "
+                          "Default: 65536 [NOSE_SPEC_CAPTURE_LIMIT]")
+        parser.add_option('--spec-traceback-frames',
+                          metavar="N",
+                          type=int,
+                          default=int(
+                              env.get('NOSE_SPEC_TRACEBACK_FRAMES') or 100
+                          ),
+                          help="Show at most the innermost N frames of each "
+                          "traceback; 0 for all of them. Default: 100 "
+                          "[NOSE_SPEC_TRACEBACK_FRAMES]")
+        parser.add_option('--spec-traceback-size',
+                          metavar="CHARS",
+                          type=int,
+                          default=int(
+                              env.get('NOSE_SPEC_TRACEBACK_SIZE') or 32 * 1024
+                          ),
+                          help="Trim each traceback to at most CHARS "
+                          "characters; 0 for no limit. Default: 32768 "
+                          "[NOSE_SPEC_TRACEBACK_SIZE]")
+        parser.add_option('--spec-buffer-output', action='store_true',
+                          default=env.get('NOSE_SPEC_BUFFER_OUTPUT'),
+                          help="Write spec output in batches instead of a "
+                          "line at a time [NOSE_SPEC_BUFFER_OUTPUT]")
+        parser.add_option('--spec-report',
+                          type='choice',
+                          choices=['end', 'immediate'],
+                          default=env.get('NOSE_SPEC_REPORT') or 'end',
+                          help="When to print failure tracebacks: 'end' of "
+                          "the run, or 'immediate'ly under the failing spec. "
+                          "Default: end [NOSE_SPEC_REPORT]")
+        parser.add_option('--spec-maxfail',
+                          metavar="N",
+                          type=int,
+                          default=int(env.get('NOSE_SPEC_MAXFAIL') or 0),
+                          help="Stop the run after N failures and/or errors. "
+                          "Default: 0 (never stop) [NOSE_SPEC_MAXFAIL]")
+        parser.add_option('--spec-generators',
+                          type='choice',
+                          choices=['expand', 'collapse'],
+                          default=env.get('NOSE_SPEC_GENERATORS') or 'expand',
+                          help="How to show test generators' cases: "
+                          "'expand' into a spec each, or 'collapse' into a "
+                          "line of counts per generator, spelling out only "
+                          "failing cases. Default: expand "
+                          "[NOSE_SPEC_GENERATORS]")
+        parser.add_option('--spec-order',
+                          type='choice',
+                          choices=['source', 'slowest-first'],
+                          default=env.get('NOSE_SPEC_ORDER') or 'source',
+                          help="Order to run tests in: 'source' or "
+                          "'slowest-first', according to past runs' timings. "
+                          "Default: source [NOSE_SPEC_ORDER]")
+        parser.add_option('--spec-shard',
+                          metavar="INDEX/TOTAL",
+                          default=env.get('NOSE_SPEC_SHARD'),
+                          help="Only run shard INDEX (counting from 1) of "
+                          "TOTAL, see --spec-shard-by [NOSE_SPEC_SHARD]")
+        parser.add_option('--spec-shard-by',
+                          type='choice',
+                          choices=['hash', 'time'],
+                          default=env.get('NOSE_SPEC_SHARD_BY') or 'hash',
+                          help="How --spec-shard splits the suite: 'hash' "
+                          "assigns top-level contexts (modules' outermost "
+                          "classes & functions) by a stable hash of their "
+                          "name, 'time' deals out test modules by expected "
+                          "runtime. Default: hash [NOSE_SPEC_SHARD_BY]")
+        parser.add_option('--spec-record-timings', action='store_true',
+                          default=env.get('NOSE_SPEC_RECORD_TIMINGS'),
+                          help="Update the timing history in .spec_cache/ "
+                          "even when not ordering or sharding by it "
+                          "[NOSE_SPEC_RECORD_TIMINGS]")
 
     def configure(self, options, config):
         # Configure
@@ -344,6 +807,35 @@ class SpecPlugin(Plugin):
         self.spec_doctests = options.spec_doctests
         self.show_timing = options.with_timing
         self.timing_threshold = options.timing_threshold
+        self.workers = options.spec_workers
+        self.slowest = options.spec_slowest
+        self.jsonl_path = options.spec_jsonl
+        self.buffer_output = options.spec_buffer_output
+        self.capture_limit = options.spec_capture_limit
+        self.traceback_frames = options.spec_traceback_frames
+        self.traceback_size = options.spec_traceback_size
+        self.report_mode = options.spec_report
+        self.maxfail = options.spec_maxfail
+        self.generators = options.spec_generators
+        # Collapsed generators may have huge numbers of (huge) arguments.
+        self.bounded = self.generators == 'collapse'
+        self.order = options.spec_order
+        self.shard = None
+        if options.spec_shard:
+            try:
+                self.shard = schedule.parse_shard(options.spec_shard)
+            except ValueError as e:
+                # Exits, reporting it like any other bad option value.
+                config.getParser().error(str(e))
+        self.shard_by = options.spec_shard_by
+        # Timing history is only updated when asked to, or when ordering by
+        # it, and never with spec's on-disk state turned off (--no-spec-cache,
+        # from the spec selector plugin.) Shards only ever read it unless told
+        # otherwise: they all have to see the same history to agree on a split.
+        self.keep_history = bool(
+            options.spec_record_timings
+            or (self.order != 'source' and not self.shard)
+        ) and not getattr(options, 'no_spec_cache', False)
         # Color setup
         for label, color in list({
             'error': 'red',
@@ -367,44 +859,320 @@ class SpecPlugin(Plugin):
     def begin(self):
         self.current_context = None
         self.start_time = time.time()
+        # Plugin instances may be reused for several runs (e.g. spec --watch)
+        self._failures, self._errors = [], []
+        self._contexts, self._context_indices = [], {}
+        # Timing bookkeeping for --spec-slowest: bounded heaps of the slowest
+        # (seconds, description) tests & (seconds, fixture seconds,
+        # description) contexts, plus a stack of [context, start time, time
+        # spent in tests & subcontexts] for contexts currently running.
+        self._slow_tests = []
+        self._slow_contexts = []
+        self._context_stack = []
+        # (filename, key, seconds) durations for the timing history, where
+        # key is a test's call or a context's class path ('' for modules.)
+        self._timings = []
+        self.history = None
+        if self.keep_history or self.order != 'source' or self.shard:
+            self.history = schedule.TimingHistory()
+        # Unbuffered & append-only, so lines written by worker processes
+        # sharing the file don't clobber each other.
+        self.jsonl = None
+        if self.jsonl_path:
+            open(self.jsonl_path, 'w').close()
+            self.jsonl = io.open(self.jsonl_path, 'ab', buffering=0)
+        # Failures & errors seen so far, for --spec-maxfail.
+        self.failed = 0
+        self.stopped = False
+        self._result = None
+        # With --spec-generators=collapse, the generator whose cases are
+        # running: [generator, label, counts by status, start time, runtime
+        # of its cases, timing history address or None.]
+        self._generator = None
+
+    def prepareTestResult(self, result):
+        # Only kept so --spec-maxfail can tell the run to stop.
+        self._result = result
+
+    def prepareTest(self, test):
+        if self.order != 'source' or self.shard:
+            test = schedule.arrange(
+                test, self.history, self.order, self.shard, self.shard_by,
+            )
+        if self.workers > 1 and workers.can_fork():
+            return workers.WorkerSuite(test, self, self.workers)
+        return test
 
     def setOutputStream(self, stream):
-        self.stream = SpecOutputStream(stream, open(os.devnull, 'w'))
+        self.stream = SpecOutputStream(
+            stream, buffered=self.buffer_output,
+            capture_limit=self.capture_limit,
+        )
         return self.stream
 
     def beforeTest(self, test):
+        if self.generators == 'collapse':
+            generator = generatorOf(test)
+            if self._generator and self._generator[0] is not generator:
+                self.finish_generator()
+            if generator is not None and self._generator is None:
+                self.start_generator(test, generator)
         context = testContext(test)
         if context != self.current_context:
             self._print_context(context)
             self.current_context = context
 
         self.stream.off()
-        test._starttime = time.time()
+        # One test runs at a time, so this needn't be stored on the test.
+        self._started = time.time()
+
+    def startContext(self, context):
+        self._context_stack.append([context, time.time(), 0])
+
+    def stopContext(self, context):
+        # Generators' cases never span a context's end.
+        self.finish_generator()
+        if inspect.isclass(context) or inspect.ismodule(context):
+            contexts.stop(context)
+        # Contexts normally stop in reverse order, but don't count on it.
+        for index in range(len(self._context_stack) - 1, -1, -1):
+            if self._context_stack[index][0] is context:
+                break
+        else:
+            return
+        _, start, inner = self._context_stack.pop(index)
+        total = time.time() - start
+        fixtures = max(total - inner, 0)
+        address = schedule.context_address(context)
+        if self.keep_history and address is not None:
+            self._timings.append(address + (fixtures,))
+        if self.slowest:
+            description = contextDescription(context) or six.text_type(context)
+            self.record_slowest(self._slow_contexts, (
+                total, fixtures, description.strip(),
+            ))
+        if self._context_stack:
+            self._context_stack[-1][2] += total
+
+    def start_generator(self, test, generator):
+        label = ""
+        # Function generators are contexts, and thus already printed.
+        if testContext(test) is not generator:
+            label = generator.__doc__ or underscored2spec(generator.__name__)
+            label = label.strip() + ": "
+        self._generator = [generator, label, {}, time.time(), 0, None]
+
+    def collapsing(self, test):
+        """
+        Whether ``test`` is a case of the generator being collapsed.
+        """
+        return (
+            self._generator is not None
+            and generatorOf(test) is self._generator[0]
+        )
+
+    def finish_generator(self):
+        """
+        Print the line of counts for the generator being collapsed, if any.
+        """
+        if self._generator is None:
+            return
+        _, label, counts, start, runtime, address = self._generator
+        self._generator = None
+        if address is not None:
+            self._timings.append(address + (runtime,))
+        total = sum(counts.values())
+        parts = []
+        for status, word in (
+            ('ok', "ok"),
+            ('failure', "failed"),
+            ('error', "error"),
+            ('skipped', "skipped"),
+            ('deprecated', "deprecated"),
+        ):
+            if counts.get(status):
+                if status == 'error' and counts[status] != 1:
+                    word += "s"
+                parts.append("%d %s" % (counts[status], word))
+        failed = counts.get('failure') or counts.get('error')
+        line = "- %s%d case%s: %s" % (
+            label, total, "s" if total != 1 else "", ", ".join(parts),
+        )
+        self.stream.print_text("%s%s (%s)\n" % (
+            self.stream._indent,
+            self.color['failure' if failed else 'ok'](line),
+            self.format_seconds(time.time() - start),
+        ))
+
+    def record_slowest(self, heap, item):
+        """
+        Add ``item`` to ``heap``, keeping only the ``--spec-slowest`` largest.
+        """
+        if len(heap) < self.slowest:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heappushpop(heap, item)
+
+    def _time(self, test):
+        """
+        Return ``test``'s runtime, recording it for --spec-slowest and the
+        timing history.
+        """
+        start, self._started = self._started, None
+        if start is None:
+            return None
+        runtime = time.time() - start
+        if self._context_stack:
+            self._context_stack[-1][2] += runtime
+        if self.slowest:
+            self.record_slowest(
+                self._slow_tests, (runtime, self._describe(test)),
+            )
+        if self.keep_history:
+            address = test_address(test)
+            if address and address[0]:
+                if self.collapsing(test):
+                    # One (total) timing per generator, not per case.
+                    self._generator[4] += runtime
+                    self._generator[5] = (address[0], address[2])
+                else:
+                    self._timings.append((address[0], address[2], runtime))
+        return runtime
+
+    def _timing_status(self, runtime, default=None):
+        if runtime is None or not self.show_timing:
+            return default
+        runtime = round(runtime, 2)
+        if runtime < self.timing_threshold:
+            return default
+        return "{0}s".format(runtime)
+
+    def _describe(self, test):
+        if not hasattr(test, 'test'):
+            return six.text_type(test)
+        context = contextDescription(testContext(test))
+        return "%s - %s" % ((context or "").strip(), self._spec_text(test))
+
+    def _spec_text(self, test):
+        spec = testDescription(test, self.bounded)
+        if isinstance(spec, types.GeneratorType):
+            spec = "; ".join(spec)
+        return (spec or "").strip()
+
+    def context_index(self, description):
+        """
+        Return the index of context ``description`` in the context table,
+        adding it if need be.
+        """
+        index = self._context_indices.get(description)
+        if index is None:
+            index = len(self._contexts)
+            self._contexts.append(description)
+            self._context_indices[description] = index
+        return index
+
+    def _record(self, test, status, runtime, trace):
+        """
+        Boil ``test`` down to a `TestRecord`, so it can be let go of.
+        """
+        context = None
+        if hasattr(test, 'test'):
+            description = self._spec_text(test)
+            text = contextDescription(testContext(test))
+            if text:
+                context = self.context_index(text.strip())
+        else:
+            description = six.text_type(test)
+        label = test.shortDescription() or six.text_type(test)
+        if self.bounded and generatorOf(test) is not None:
+            # Generated tests' labels spell out all their arguments.
+            label = shorten(label, 2 * ARG_LIMIT)
+        return TestRecord(
+            label, description, context, status, runtime, trace,
+        )
+
+    def _report(self, test, status, runtime, trace=None):
+        """
+        Write a --spec-jsonl record for ``test``.
+        """
+        if self.jsonl is None:
+            return
+        contexts = []
+        if hasattr(test, 'test'):
+            description = self._spec_text(test)
+            context = testContext(test)
+            while context is not None:
+                text = contextDescription(context) or six.text_type(context)
+                contexts.insert(0, text.strip())
+                context = getattr(context, '_parent', None)
+        else:
+            description = six.text_type(test)
+        address = test_address(test) or (None, None, None)
+        record = {
+            'description': description,
+            'contexts': contexts,
+            'depth': max(len(contexts) - 1, 0),
+            'status': status,
+            'duration': runtime,
+            'file': address[0],
+            'call': address[2],
+            'traceback': "\n".join(trace) if trace else None,
+        }
+        self.jsonl.write((json.dumps(record) + "\n").encode('utf-8'))
 
     def addSuccess(self, test):
-        runtime = round(time.time() - test._starttime, 2)
-        if runtime >= self.timing_threshold and self.show_timing:
-            status = "{0}s".format(runtime)
-        else:
-            status = None
-        self._print_spec('ok', test, status)
+        runtime = self._time(test)
+        self._print_spec('ok', test, self._timing_status(runtime))
+        self._report(test, 'ok', runtime)
 
     def addFailure(self, test, err):
-        self._print_spec('failure', test, '')
-        self._failures.append((test, err))
+        runtime = self._time(test)
+        # Format right away so the traceback's frames (and their locals)
+        # needn't be kept around until finalize().
+        trace = self.format_traceback(err)
+        self._print_spec('failure', test, self._timing_status(runtime, ''))
+        self._report(test, 'failure', runtime, trace)
+        self._failures.append(self._record(test, 'failure', runtime, trace))
+        self._note_failure(trace)
 
     def addError(self, test, err):
-        def blurt(color, label):
+        runtime = self._time(test)
+        status = self._timing_status(runtime, '')
+
+        def blurt(color, label, trace=None):
             self._print_spec(color, test, label)
+            self._report(test, color, runtime, trace)
 
         klass = err[0]
         if issubclass(klass, nose.DeprecatedTest):
-            blurt('deprecated', '')
+            blurt('deprecated', status)
         elif issubclass(klass, SkipTest):
-            blurt('skipped', '')
+            blurt('skipped', status)
         else:
-            self._errors.append((test, err))
-            blurt('error', '')
+            trace = self.format_traceback(err)
+            self._errors.append(self._record(test, 'error', runtime, trace))
+            blurt('error', status, trace)
+            self._note_failure(trace)
+
+    def _note_failure(self, trace):
+        if self.report_mode == 'immediate':
+            text = IO()
+            self.print_colorized_traceback(
+                trace, self.stream._depth + 1, stream=text,
+            )
+            self.stream.print_text(text.getvalue())
+        self.count_failures(1)
+
+    def count_failures(self, count):
+        """
+        Add ``count`` failures/errors to the tally, stopping the run once
+        ``--spec-maxfail`` of them have been seen.
+        """
+        self.failed += count
+        if self.maxfail and self.failed >= self.maxfail:
+            self.stopped = True
+            if self._result is not None:
+                self._result.shouldStop = True
 
     def afterTest(self, test):
         self.stream.capture()
@@ -414,24 +1182,71 @@ class SpecPlugin(Plugin):
             "ERROR": "error",
             "FAIL": "failure"
         }[label]
-        for item in items:
-            test, trace = item
-            desc = test.shortDescription() or six.text_type(test)
+        for record in items:
             self.stream.writeln("=" * 70)
             self.stream.writeln("%s: %s" % (
                 self.color[problem_color](label),
-                self.identifier(desc, bold=True),
+                self.identifier(record.id, bold=True),
             ))
             self.stream.writeln("-" * 70)
-            # format_exception() is...very odd re: how it breaks into lines.
-            trace = "".join(format_exception(trace)).split("\n")
-            self.print_colorized_traceback(trace)
-
-    def print_colorized_traceback(self, formatted_traceback, indent_level=0):
+            self.print_colorized_traceback(record.message)
+
+    def format_traceback(self, err):
+        """
+        Format ``err`` into a list of lines, within the configured limits.
+
+        Only the innermost ``--spec-traceback-frames`` frames are kept, and
+        output beyond ``--spec-traceback-size`` characters is cut from the
+        middle, keeping the start and (most telling) end.
+        """
+        klass, value, tb = err
+        omitted = 0
+        if self.traceback_frames:
+            frames = 0
+            node = tb
+            while node is not None:
+                frames += 1
+                node = node.tb_next
+            while frames - omitted > self.traceback_frames:
+                tb = tb.tb_next
+                omitted += 1
+        # format_exception() is...very odd re: how it breaks into lines.
+        lines = "".join(format_exception((klass, value, tb))).split("\n")
+        if omitted:
+            index = 1 if lines[0].startswith("Traceback") else 0
+            lines.insert(index, "  ... %d outermost frame%s omitted ..." % (
+                omitted, "s" if omitted != 1 else "",
+            ))
+        limit = self.traceback_size
+        size = sum(len(line) + 1 for line in lines)
+        if limit and size > limit:
+            head, tail, budget = [], [], limit // 4
+            for line in lines:
+                budget -= len(line) + 1
+                if budget < 0:
+                    break
+                head.append(line)
+            budget = limit - limit // 4
+            for line in reversed(lines[len(head):]):
+                if len(line) + 1 > budget:
+                    # Still show the start of e.g. a huge exception message.
+                    if budget > 4:
+                        tail.insert(0, line[:budget - 4] + "...")
+                    break
+                budget -= len(line) + 1
+                tail.insert(0, line)
+            cut = size - sum(len(line) + 1 for line in head + tail)
+            lines = head + ["... %d characters omitted ..." % cut] + tail
+        return lines
+
+    def print_colorized_traceback(self, formatted_traceback, indent_level=0,
+                                  stream=None):
+        if stream is None:
+            stream = self.stream
         indentation = "    " * indent_level
         for line in formatted_traceback:
             if line.startswith("  File"):
-                m = re.match(r'  File "(.*)", line (\d*)(?:, in (.*))?$', line)
+                m = TRACEBACK_FILE.match(line)
                 if m:
                     filename, lineno, test = m.groups()
                     tb_lines = [
@@ -448,24 +1263,60 @@ class SpecPlugin(Plugin):
                             self.identifier(test, bold=True)
                         ])
                     tb_lines.extend(["\n"])
-                    self.stream.write(indentation)
-                    self.stream.writelines(tb_lines)
+                    stream.write(indentation)
+                    stream.writelines(tb_lines)
                 else:
-                    six.print_(indentation + line, file=self.stream)
+                    six.print_(indentation + line, file=stream)
             elif line.startswith("    "):
-                six.print_(self.identifier(indentation + line), file=self.stream)
+                six.print_(self.identifier(indentation + line), file=stream)
             elif line.startswith("Traceback (most recent call last)"):
-                six.print_(indentation + line, file=self.stream)
+                six.print_(indentation + line, file=stream)
             else:
-                six.print_(self.error(indentation + line), file=self.stream)
+                six.print_(self.error(indentation + line), file=stream)
 
     def finalize(self, result):
+        self.finish_generator()
+        self.stream.flush_pending()
+        if self.jsonl is not None:
+            self.jsonl.close()
+        if self.keep_history:
+            for path, key, runtime in self._timings:
+                self.history.record(path, key, runtime)
+            self.history.save()
         self.stream.on()
         six.print_("", file=self.stream)
-        self.print_tracebacks("ERROR", self._errors)
-        self.print_tracebacks("FAIL", self._failures)
+        if self.report_mode != 'immediate':
+            self.print_tracebacks("ERROR", self._errors)
+            self.print_tracebacks("FAIL", self._failures)
+        if self.stopped:
+            six.print_(self.error(
+                "Stopped after %d failure%s (--spec-maxfail=%d)\n" % (
+                    self.failed, "s" if self.failed != 1 else "",
+                    self.maxfail,
+                )
+            ), file=self.stream)
+        if self.slowest:
+            self.print_slowest()
         self.print_summary(result)
 
+    def print_slowest(self):
+        tests = sorted(self._slow_tests, reverse=True)
+        six.print_("Slowest %s test%s:" % (
+            len(tests), "s" if len(tests) != 1 else "",
+        ), file=self.stream)
+        for runtime, description in tests:
+            six.print_("  %8.3fs  %s" % (runtime, description),
+                       file=self.stream)
+        contexts = sorted(self._slow_contexts, reverse=True)
+        six.print_("Slowest %s context%s (of which setup/teardown):" % (
+            len(contexts), "s" if len(contexts) != 1 else "",
+        ), file=self.stream)
+        for total, fixtures, description in contexts:
+            six.print_("  %8.3fs (%7.3fs)  %s" % (
+                total, fixtures, description
+            ), file=self.stream)
+        six.print_("", file=self.stream)
+
     def print_summary(self, result):
         # Setup
         num_tests = result.testsRun
@@ -522,4 +1373,10 @@ class SpecPlugin(Plugin):
         if not hasattr(test, 'test') or \
            isinstance(test.test, doctest.DocTestCase) and not self.spec_doctests:
             return
-        self.stream.print_spec(self.color[color], test, status)
+        if self.collapsing(test):
+            counts = self._generator[2]
+            counts[color] = counts.get(color, 0) + 1
+            # Only failing cases are worth a line of their own.
+            if color not in ('failure', 'error'):
+                return
+        self.stream.print_spec(self.color[color], test, status, self.bounded)
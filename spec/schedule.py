@@ -0,0 +1,294 @@
+"""
+Test scheduling for ``--spec-order`` and ``--spec-shard``.
+
+`SpecPlugin` keeps a running history of how long each test (and each context's
+setup/teardown) took. Before a run, the loaded suite is materialized and every
+node weighed by its expected duration, so it can be reordered slowest-first
+and/or cut down to one of several shards of roughly equal expected runtime.
+Alternatively shards are assigned by a stable hash of each top-level context's
+name, which needs no shared history at all. The tree structure itself is left
+intact, so fixtures & spec output behave just as in a normal run.
+"""
+import inspect
+import os
+import zlib
+
+import six
+from nose.suite import LazySuite
+
+from spec import cache
+from spec.cache import class_path, module_file, source_file, test_address
+
+
+def context_address(context):
+    """
+    Return a ``(filename, key)`` history address for a module or class.
+
+    Modules are keyed by the empty string, classes by their `class_path`.
+    """
+    if inspect.ismodule(context):
+        path = getattr(context, '__file__', None)
+        return (source_file(path), '') if path else None
+    if inspect.isclass(context):
+        path = module_file(context)
+        return (path, class_path(context)) if path else None
+    return None
+
+
+def parse_shard(value):
+    """
+    Parse an ``INDEX/TOTAL`` shard spec (1-based) into an ``(index, total)``.
+    """
+    try:
+        index, total = [int(x) for x in value.split('/')]
+    except ValueError:
+        index, total = 0, 0
+    if not 1 <= index <= total:
+        raise ValueError(
+            "--spec-shard expects INDEX/TOTAL with 1 <= INDEX <= TOTAL, "
+            "e.g. 1/4 (got %r)" % value
+        )
+    return index, total
+
+
+class TimingHistory(object):
+    """
+    Per source file record of how long each test & context fixture took.
+
+    Stored durations are running averages, weighted towards recent runs.
+    """
+    filename = 'timings.json'
+    # Share of the newest duration in each running average.
+    weight = 0.5
+
+    def __init__(self):
+        self.entries = cache.load(self.filename, {})
+        self._default = None
+
+    def record(self, path, key, runtime):
+        keys = self.entries.setdefault(path, {})
+        old = keys.get(key)
+        if old is not None:
+            runtime = old + (runtime - old) * self.weight
+        keys[key] = runtime
+
+    def default(self):
+        """
+        Expected duration of tests with no history: the mean of known ones,
+        or 1 second when nothing is known (i.e. weigh tests by count.)
+        """
+        if self._default is None:
+            known = [
+                runtime for keys in six.itervalues(self.entries)
+                # Skip module fixture entries (keyed '')
+                for key, runtime in six.iteritems(keys) if key
+            ]
+            self._default = sum(known) / len(known) if known else 1.0
+        return self._default
+
+    def expected(self, test):
+        address = test_address(test)
+        if address and address[0]:
+            runtime = self.entries.get(address[0], {}).get(address[2])
+            if runtime is not None:
+                return runtime
+        return self.default()
+
+    def fixtures(self, context):
+        address = context_address(context)
+        if address is None:
+            return 0
+        return self.entries.get(address[0], {}).get(address[1], 0)
+
+    def save(self):
+        # Forget files which have since gone away entirely.
+        for path in list(self.entries):
+            if not os.path.exists(path):
+                del self.entries[path]
+        cache.save(self.filename, self.entries)
+
+
+def is_container(test):
+    """
+    Is ``test`` a directory or package suite (as opposed to a test module)?
+    """
+    context = getattr(test, 'context', None)
+    return isinstance(test, LazySuite) and (
+        context is None or hasattr(context, '__path__')
+    )
+
+
+def expandable(test):
+    """
+    Can ``test``'s contents be loaded up front?
+
+    True for directory, module & class suites; not for test generators, which
+    mustn't run until their module's fixtures have.
+    """
+    context = getattr(test, 'context', None)
+    return isinstance(test, LazySuite) and (
+        context is None or inspect.ismodule(context)
+        or inspect.isclass(context)
+    )
+
+
+def children(suite):
+    """
+    Return ``suite``'s tests, storing them so it can be iterated again later.
+    """
+    tests = list(suite)
+    suite._set_tests(tests)
+    return tests
+
+
+def weigh(test, history, weights):
+    """
+    Fill ``weights`` (keyed by id) with the expected duration of ``test`` and
+    everything beneath it; returns ``test``'s own.
+    """
+    if expandable(test):
+        total = history.fixtures(getattr(test, 'context', None))
+        for child in children(test):
+            total += weigh(child, history, weights)
+    else:
+        total = history.expected(test)
+    weights[id(test)] = total
+    return total
+
+
+def is_module(test):
+    return isinstance(test, LazySuite) and inspect.ismodule(
+        getattr(test, 'context', None)
+    )
+
+
+def relative(path):
+    """
+    ``path`` relative to where spec was launched from, '/'-separated.
+    """
+    path = os.path.relpath(path, cache.launch_dir)
+    return path.replace(os.sep, '/')
+
+
+def top_level(suite):
+    """
+    Yield ``(test, name)`` for each top-level context in ``suite``.
+
+    Outermost classes are named ``path::Class``; a module's remaining tests
+    (functions & generators) share the name ``path``, as do bare tests found
+    outside of any module.
+    """
+    for test in children(suite):
+        if is_container(test):
+            for item in top_level(test):
+                yield item
+        elif is_module(test):
+            path = getattr(test.context, '__file__', None)
+            if path:
+                path = relative(source_file(path))
+            else:
+                path = test.context.__name__
+            for child in children(test):
+                context = getattr(child, 'context', None)
+                if isinstance(child, LazySuite) and inspect.isclass(context):
+                    yield child, "%s::%s" % (path, class_path(context))
+                else:
+                    yield child, path
+        else:
+            address = test_address(test)
+            if address and address[0]:
+                yield test, relative(address[0])
+            else:
+                yield test, six.text_type(test)
+
+
+def stable_hash(name):
+    """
+    Hash of ``name`` which is the same in every process & Python version.
+    """
+    return zlib.crc32(name.encode('utf-8')) & 0xffffffff
+
+
+def units(suite):
+    """
+    Yield the pieces of ``suite`` shards are made of: test modules, plus any
+    bare tests found outside of one.
+    """
+    for test in children(suite):
+        if is_container(test):
+            for unit in units(test):
+                yield unit
+        else:
+            yield test
+
+
+def balance(pieces, weights, total):
+    """
+    Deal ``pieces`` out into ``total`` shards of similar overall weight.
+
+    Heaviest pieces go first, each to the currently lightest shard; ties fall
+    back to load order, so every shard computes the same assignment.
+    """
+    loads = [0.0] * total
+    shards = [set() for _ in range(total)]
+    ranked = sorted(
+        enumerate(pieces), key=lambda x: (-weights[id(x[1])], x[0]),
+    )
+    for _, piece in ranked:
+        index = loads.index(min(loads))
+        loads[index] += weights[id(piece)]
+        shards[index].add(id(piece))
+    return shards
+
+
+def prune(suite, keep):
+    """
+    Drop everything from ``suite`` but the units whose ids are in ``keep``
+    (and the containers & modules leading to them.)
+    """
+    tests = []
+    for test in children(suite):
+        if id(test) in keep:
+            tests.append(test)
+        elif is_container(test) or is_module(test):
+            if prune(test, keep):
+                tests.append(test)
+    suite._set_tests(tests)
+    return tests
+
+
+def slowest_first(suite, weights):
+    if expandable(suite):
+        # A class' own tests still come before its inner classes, so each
+        # context's specs are printed together.
+        tests = sorted(children(suite), key=lambda x: (
+            isinstance(x, LazySuite), -weights[id(x)],
+        ))
+        for test in tests:
+            slowest_first(test, weights)
+        suite._set_tests(tests)
+
+
+def arrange(suite, history, order='source', shard=None, shard_by='hash'):
+    """
+    Reorder and/or shard ``suite`` in place, returning it.
+
+    ``shard`` is an ``(index, total)`` tuple as returned by `parse_shard`;
+    ``shard_by`` is ``'hash'`` (by top-level context) or ``'time'``.
+    """
+    weights = {}
+    if order == 'slowest-first' or (shard and shard_by == 'time'):
+        weigh(suite, history, weights)
+    if shard is not None:
+        index, total = shard
+        if shard_by == 'time':
+            keep = balance(list(units(suite)), weights, total)[index - 1]
+        else:
+            keep = set(
+                id(test) for test, name in top_level(suite)
+                if stable_hash(name) % total == index - 1
+            )
+        prune(suite, keep)
+    if order == 'slowest-first':
+        slowest_first(suite, weights)
+    return suite
@@ -8,12 +8,15 @@ Based on original code from Fabric 1.x, specifically:
 
 Though modifications have been made since.
 """
+import codecs
 import sys
-from functools import wraps
+from functools import partial, wraps
 
 import six
 from six import BytesIO as IO
 
+from spec import coroutines
+
 
 class CarbonCopy(IO):
     """
@@ -57,25 +60,225 @@ class CarbonCopy(IO):
         return ret
 
 
-def trap(func):
+class Capture(object):
+    """
+    Everything written to a set of `CaptureStream` objects, in write order.
+
+    Consecutive writes through the same stream are gathered into one chunk
+    (joined once `run_size` of them pile up, or another stream is written
+    to), each stream remembering the indices of its own chunks. Chunks are
+    kept as written, text or bytes; nothing is encoded or decoded until read.
+
+    Past ``limit`` characters (or bytes, for binary writes) output is cut
+    short -- the write crossing the limit is trimmed to fit and followed by
+    `marker`, later ones are dropped, all of it counted in ``dropped`` --
+    unless ``spill`` is set, in which case all chunks move to a temporary
+    file instead, held in memory only as ``(start, end)`` byte ranges.
+    """
+    run_size = 512
+    marker = "[output truncated]"
+
+    def __init__(self, limit=None, spill=False):
+        self.chunks = []
+        # The stream each chunk was written through
+        self.owners = []
+        self.size = 0
+        self.dropped = 0
+        self.truncated = False
+        self.limit = limit
+        self.spill = spill
+        self.file = None
+        # The stream (and type of data) currently being written, and the
+        # writes not yet joined into a chunk.
+        self.owner = None
+        self.kind = None
+        self.pending = []
+
+    def write(self, stream, data):
+        if self.limit is not None and self.file is None \
+                and self.size + len(data) > self.limit:
+            if not self.spill:
+                self._truncate(stream, data)
+                return
+            self.seal()
+            self._spill()
+        self._append(stream, data)
+
+    def _append(self, stream, data):
+        if stream is not self.owner or type(data) is not self.kind:
+            self.seal()
+            self.owner, self.kind = stream, type(data)
+        self.pending.append(data)
+        self.size += len(data)
+        if len(self.pending) >= self.run_size:
+            self.seal()
+
+    def _truncate(self, stream, data):
+        """
+        Keep as much of ``data`` as still fits, then `marker`, once.
+        """
+        if self.truncated:
+            self.dropped += len(data)
+            return
+        self.truncated = True
+        room = max(self.limit - self.size, 0)
+        if isinstance(data, six.binary_type):
+            # Don't cut a UTF-8 encoded character in half.
+            while 0 < room < len(data) and \
+                    six.indexbytes(data, room) & 0xC0 == 0x80:
+                room -= 1
+            marker = self.marker.encode('utf-8')
+        else:
+            marker = six.text_type(self.marker)
+        self.dropped += len(data) - room
+        if room:
+            self._append(stream, data[:room])
+        self._append(stream, marker)
+
+    def seal(self):
+        """
+        Turn pending writes into a chunk.
+        """
+        if not self.pending:
+            return
+        chunk = self.kind().join(self.pending)
+        self.pending = []
+        if self.file is not None:
+            chunk = self._store(chunk)
+        self.chunks.append(chunk)
+        self.owners.append(self.owner)
+        if self.owner.indices is not None:
+            self.owner.indices.append(len(self.chunks) - 1)
+
+    def _spill(self):
+        import tempfile
+        self.file = tempfile.TemporaryFile()
+        self.chunks = [self._store(x) for x in self.chunks]
+
+    def _store(self, chunk):
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode('utf-8')
+        start = self.file.tell()
+        self.file.write(chunk)
+        return (start, start + len(chunk))
+
+    def read(self, index):
+        """
+        Return chunk ``index``, as text or bytes.
+        """
+        chunk = self.chunks[index]
+        if isinstance(chunk, tuple):
+            start, end = chunk
+            self.file.seek(start)
+            chunk = self.file.read(end - start)
+            self.file.seek(0, 2)
+        return chunk
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class CaptureStream(object):
+    """
+    A stand-in for ``sys.stdout`` & co, storing writes in a shared `Capture`.
+
+    One created with ``all_chunks=True`` writes nothing of its own, reading
+    back every stream's writes instead (i.e. ``sys.stdall``.) `getvalue`
+    decodes only the chunks added since it was last called, keeping a
+    decoder per stream so bytes split across writes to one stream don't get
+    mixed up with another's.
+    """
+    encoding = 'utf-8'
+
+    def __init__(self, capture, all_chunks=False):
+        self.capture = capture
+        self.indices = None if all_chunks else []
+        self._text = []
+        self._read = 0
+        self._decoders = {}
+
+    def write(self, s):
+        # Both text & bytes are fine here, so there's no need to encode.
+        self.capture.write(self, s)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    # Real sys.std(out|err) in Py3 have a buffer attribute for writing bytes
+    # to, which some code relies on.
+    @property
+    def buffer(self):
+        return self
+
+    def _decoder(self, stream):
+        decoder = self._decoders.get(stream)
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            self._decoders[stream] = decoder
+        return decoder
+
+    def getvalue(self):
+        """
+        Return everything written so far, as a string.
+        """
+        self.capture.seal()
+        indices = self.indices
+        if indices is None:
+            indices = range(len(self.capture.chunks))
+        for index in indices[self._read:]:
+            chunk = self.capture.read(index)
+            if isinstance(chunk, six.binary_type):
+                decoder = self._decoder(self.capture.owners[index])
+                chunk = decoder.decode(chunk)
+            self._text.append(chunk)
+        self._read = len(indices)
+        # Keep the joined result, so the next call only joins new text.
+        value = "".join(self._text)
+        self._text = [value]
+        return value
+
+
+def trap(func=None, limit=None, spill=False):
     """
     Replace sys.std(out|err) with a wrapper during execution, restored after.
 
     In addition, a new combined-streams output (another wrapper) will appear at
     ``sys.stdall``. This stream will resemble what a user sees at a terminal,
     i.e. both out/err streams intermingled.
+
+    ``async def`` functions are run to completion on their context's event
+    loop (see `spec.coroutines`), all of it trapped.
+
+    May also be called with arguments, as ``@trap(limit=N)``: at most ``N``
+    characters of output are then captured, followed by an "[output
+    truncated]" marker; with ``spill=True`` output past that goes to a
+    temporary file instead of being dropped.
     """
+    if func is None:
+        return partial(trap, limit=limit, spill=spill)
+    if coroutines.is_coroutine_function(func):
+        # Run to completion (on the context's loop) within the trap.
+        func = coroutines.synchronous(func)
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        # Use another CarbonCopy even though we're not cc'ing; for our "write
-        # bytes, return strings on py3" behavior. Meh.
-        sys.stdall = CarbonCopy()
-        my_stdout, sys.stdout = sys.stdout, CarbonCopy(cc=sys.stdall)
-        my_stderr, sys.stderr = sys.stderr, CarbonCopy(cc=sys.stdall)
+        capture = Capture(limit=limit, spill=spill)
+        sys.stdall = CaptureStream(capture, all_chunks=True)
+        my_stdout, sys.stdout = sys.stdout, CaptureStream(capture)
+        my_stderr, sys.stderr = sys.stderr, CaptureStream(capture)
         try:
             return func(*args, **kwargs)
         finally:
             sys.stdout = my_stdout
             sys.stderr = my_stderr
             del sys.stdall
+            capture.close()
     return wrapper
@@ -1,6 +1,9 @@
 import six
 
-from nose.util import isclass
+
+def isclass(obj):
+    # As nose.util.isclass (old-style classes too), without importing nose.
+    return isinstance(obj, six.class_types)
 
 
 def hide(obj):
@@ -16,7 +19,10 @@ def is_public_class(name, value):
 def class_members(obj):
     return [x for x in six.iteritems(vars(obj)) if is_public_class(*x)]
 
-def my_getattr(self, name):
+def parent_instance(self):
+    """
+    Return the (set up) instance of inner class instance ``self``'s parent.
+    """
     if not self._parent_inst:
         parent = self._parent()
         if hasattr(parent, 'setup') and callable(getattr(parent, 'setup')):
@@ -25,7 +31,10 @@ def my_getattr(self, name):
             # on. (CAN there be any inheritance going on?)
             parent.setup()
         self._parent_inst = parent
-    return getattr(self._parent_inst, name)
+    return self._parent_inst
+
+def my_getattr(self, name):
+    return getattr(parent_instance(self), name)
 
 def flag_inner_classes(obj):
     """
@@ -44,11 +53,14 @@ def flag_inner_classes(obj):
 
 def autohide(obj):
     """
-    Automatically hide setup() and teardown() methods, recursively.
+    Automatically hide setup() and teardown() methods (per test & per
+    context), recursively.
     """
     # Members on obj
     for name, item in six.iteritems(vars(obj)):
-        if callable(item) and name in ('setup', 'teardown'):
+        if callable(item) and name in (
+            'setup', 'teardown', 'setup_context', 'teardown_context',
+        ):
             item = hide(item)
     # Recurse into class members
     for name, subclass in class_members(obj):
@@ -63,7 +75,10 @@ class InnerClassParser(type):
     inner class or a top level one.
     """
     def __new__(cls, name, bases, attrs):
+        # (spec.contexts builds on this module.)
+        from spec.contexts import prepare
         new_class = type.__new__(cls, name, bases, attrs)
         flag_inner_classes(new_class)
+        prepare(new_class)
         autohide(new_class)
         return new_class
@@ -0,0 +1,384 @@
+"""
+``spec --watch``: rerun affected specs whenever source files change.
+
+The first run is a regular one, made within a long-lived interpreter which
+records who imports what (see `spec.changed.ImportRecorder`). From then on,
+each batch of changed ``.py`` files under the launch directory -- tests and
+project source alike -- is mapped to the modules loaded from them and all
+modules (transitively) importing those. Only these are dropped from
+``sys.modules``, so they get re-imported fresh; the test modules among them
+are then rerun, through the same already configured nose & plugins,
+``SpecSelector`` picking their specs as usual. Everything else (nose, spec,
+third party and unaffected project modules) stays loaded.
+
+Changes are noticed through inotify where available (Linux), else by polling
+file stamps.
+"""
+from __future__ import print_function
+
+import importlib
+import linecache
+import os
+import select
+import struct
+import sys
+import time
+from collections import defaultdict
+
+import nose
+import six
+
+from spec import cache, plugin
+from spec.changed import ImportRecorder
+
+
+# inotify(7) constants
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+    | IN_DELETE
+)
+EVENT = struct.Struct('iIII')
+
+# How long files must go unchanged before a rerun starts, in seconds, so that
+# e.g. an editor's save-as-rename or a VCS checkout triggers a single rerun.
+SETTLE = 0.1
+
+
+def watched_dirs(root):
+    """
+    Yield ``root`` and the directories below it worth watching.
+
+    Hidden directories (VCS, caches...), bytecode caches and virtualenvs are
+    skipped.
+    """
+    for path, dirs, files in os.walk(root):
+        dirs[:] = [
+            x for x in dirs
+            if not x.startswith('.') and x != '__pycache__'
+            and not x.endswith('.egg-info')
+            and not os.path.exists(os.path.join(path, x, 'pyvenv.cfg'))
+        ]
+        yield path
+
+
+class PollingWatcher(object):
+    """
+    Notices changed files by comparing the stat() of every ``.py`` file under
+    ``root`` every `interval` seconds.
+    """
+    interval = 0.5
+
+    def __init__(self, root):
+        self.root = root
+        self.stamps = self.scan()
+
+    def scan(self):
+        stamps = {}
+        for path in watched_dirs(self.root):
+            for name in os.listdir(path):
+                if name.endswith('.py'):
+                    filename = os.path.join(path, name)
+                    try:
+                        stat = os.stat(filename)
+                    except OSError:
+                        continue
+                    stamps[filename] = (stat.st_mtime, stat.st_size)
+        return stamps
+
+    def wait(self, timeout=None):
+        """
+        Return the set of files changed, created or deleted since last time,
+        waiting up to ``timeout`` seconds (forever if None) for there to be
+        any.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            stamps = self.scan()
+            changed = set(
+                path for path in set(stamps) | set(self.stamps)
+                if stamps.get(path) != self.stamps.get(path)
+            )
+            self.stamps = stamps
+            if changed or (deadline is not None and time.time() >= deadline):
+                return changed
+            delay = self.interval
+            if deadline is not None:
+                delay = max(min(delay, deadline - time.time()), 0)
+            time.sleep(delay)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    Notices changed files through inotify, watching every directory under
+    ``root`` (including ones created later on.)
+
+    Raises OSError or AttributeError when inotify isn't available.
+    """
+    def __init__(self, root):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(
+            ctypes.util.find_library('c') or 'libc.so.6', use_errno=True,
+        )
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        # Watched directories, by watch descriptor
+        self.dirs = {}
+        self.add(root)
+
+    def add(self, root):
+        """
+        Watch ``root`` & the directories below it; returns the ``.py`` files
+        in them.
+        """
+        found = set()
+        for path in watched_dirs(root):
+            wd = self.libc.inotify_add_watch(
+                self.fd, path.encode(sys.getfilesystemencoding()), WATCH_MASK,
+            )
+            if wd >= 0:
+                self.dirs[wd] = path
+            found.update(
+                os.path.join(path, x) for x in os.listdir(path)
+                if x.endswith('.py')
+            )
+        return found
+
+    def wait(self, timeout=None):
+        """
+        Like `PollingWatcher.wait`, only woken up by the kernel.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if wd not in self.dirs:
+                continue
+            path = os.path.join(
+                self.dirs[wd], name.decode(sys.getfilesystemencoding()),
+            )
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may have been put there before it was watched.
+                    changed.update(self.add(path))
+            elif path.endswith('.py'):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(root):
+    """
+    Return an inotify based watcher for ``root`` if possible, else a polling
+    one.
+    """
+    try:
+        return InotifyWatcher(root)
+    except (OSError, AttributeError):
+        return PollingWatcher(root)
+
+
+def modules_of(paths):
+    """
+    Return the names of loaded modules whose source is one of ``paths``.
+    """
+    paths = set(os.path.abspath(x) for x in paths)
+    names = set()
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if path and cache.source_file(path) in paths:
+            names.add(name)
+    return names
+
+
+def importers(edges, names):
+    """
+    Return ``names`` plus the modules which (transitively) import any of
+    them, given ``edges`` from `ImportRecorder`.
+    """
+    reverse = defaultdict(set)
+    for importer, targets in six.iteritems(edges):
+        for target in targets:
+            reverse[target].add(importer)
+    found, pending = set(names), list(names)
+    while pending:
+        for importer in reverse.get(pending.pop(), ()):
+            if importer not in found:
+                found.add(importer)
+                pending.append(importer)
+    return found
+
+
+class RerunProgram(nose.core.TestProgram):
+    """
+    A `nose.core.TestProgram` running ``names`` instead of the test names in
+    its ``argv``.
+
+    ``Config.configure`` resets the config's test names from the command line,
+    so they're only swapped in once it's done -- still ahead of the loader
+    and its selector, which take them from there.
+    """
+    def __init__(self, names, **kwargs):
+        self.names = names
+        nose.core.TestProgram.__init__(self, **kwargs)
+
+    def parseArgs(self, argv):
+        config = self.config
+        configure = config.configure
+
+        def configure_names(*args, **kwargs):
+            configure(*args, **kwargs)
+            config.testNames = list(self.names)
+        config.configure = configure_names
+        try:
+            nose.core.TestProgram.parseArgs(self, argv)
+        finally:
+            del config.configure
+
+
+class Watcher(object):
+    """
+    Runs nose with ``argv`` & extra ``plugins``, then again for the test
+    modules affected by each change.
+    """
+    def __init__(self, argv, plugins, root=None, stream=sys.stderr):
+        self.argv = argv
+        self.plugins = plugins
+        self.root = os.path.abspath(root or cache.launch_dir)
+        self.stream = stream
+        self.config = None
+        self.selector = None
+        # Test names given on the command line, if any.
+        self.names = None
+        # Modules loaded before any test ran are never reloaded: nose, spec,
+        # and whatever else the runner itself depends on.
+        self.baseline = set(sys.modules)
+        self.recorder = ImportRecorder()
+        # Files of test modules seen so far, by module name.
+        self.test_files = {}
+
+    def run(self, names=None):
+        """
+        Run the tests in files ``names`` (all of them if None.)
+        """
+        os.chdir(self.root)
+        # Let new files be found & tracebacks show current source.
+        if hasattr(importlib, 'invalidate_caches'):
+            importlib.invalidate_caches()
+        linecache.checkcache()
+        if self.config is None:
+            program = nose.core.TestProgram(
+                argv=self.argv, exit=False, addplugins=self.plugins,
+            )
+        else:
+            # Reused as is: nose only loads plugins once. These names are
+            # also what SpecSelector accepts modules loaded by name from.
+            program = RerunProgram(
+                self.names if names is None else names,
+                argv=self.argv, config=self.config, exit=False,
+            )
+        if self.config is None:
+            self.config = program.config
+            self.names = list(self.config.testNames)
+        self.selector = getattr(program.testLoader, 'selector', None)
+        for module in getattr(self.selector, '_valid_modules', {}).values():
+            path = getattr(module, '__file__', None)
+            if path:
+                self.test_files[module.__name__] = cache.source_file(path)
+        os.chdir(self.root)
+        return program.success
+
+    def affected(self, paths):
+        """
+        Forget the modules affected by changes to ``paths``, returning the
+        test files to rerun -- or None when that can't be narrowed down.
+        """
+        names = importers(self.recorder.edges, modules_of(paths))
+        names -= self.baseline
+        for name in names:
+            sys.modules.pop(name, None)
+        # Nor should spec keep the old modules (and classes) alive.
+        plugin.forgetContexts(names)
+        if not hasattr(self.selector, '_valid_modules'):
+            # Not a SpecSelector; no telling test modules apart.
+            return None
+        files = set(
+            path for name, path in six.iteritems(self.test_files)
+            if name in names
+        )
+        # New (or so far unimportable) test modules count, too.
+        where = self.config.workingDir or self.root
+        for path in paths:
+            path = os.path.abspath(path)
+            if (
+                path.startswith(os.path.join(where, ''))
+                and self.selector.wantFile(path)
+            ):
+                files.add(path)
+        return sorted(x for x in files if os.path.exists(x))
+
+    def report(self, paths, files):
+        print("\nChanged: %s" % ", ".join(
+            os.path.relpath(x, self.root) for x in sorted(paths)
+        ), file=self.stream)
+        if files is not None and not files:
+            print("No affected test modules.", file=self.stream)
+
+    def watch(self):
+        """
+        Run all tests, then affected ones on each change, until interrupted.
+        """
+        self.recorder.install()
+        watcher = make_watcher(self.root)
+        success = False
+        try:
+            success = self.run()
+            while True:
+                print("Watching for changes (Ctrl-C to quit)...",
+                      file=self.stream)
+                paths = set()
+                while not paths:
+                    paths = watcher.wait()
+                while True:
+                    more = watcher.wait(SETTLE)
+                    if not more:
+                        break
+                    paths |= more
+                files = self.affected(paths)
+                self.report(paths, files)
+                if files is None:
+                    success = self.run()
+                elif files:
+                    success = self.run(files)
+        except KeyboardInterrupt:
+            print("", file=self.stream)
+        finally:
+            watcher.close()
+            self.recorder.uninstall()
+        return success
+
+
+def main(argv, plugins):
+    sys.exit(not Watcher(argv, plugins).watch())
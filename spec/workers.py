@@ -0,0 +1,183 @@
+"""
+Multi-process test execution for ``--spec-workers``.
+
+The suite is loaded once in the parent process and split into one chunk per
+test module. Each chunk is run in a child forked from the parent (so nothing
+needs to be re-imported or pickled on the way in), with the child's copy of
+`SpecPlugin` writing into a buffer instead of the terminal. Children send back
+that rendered output plus their tracebacks & result counts; the parent prints
+chunk output in source order and merges everything else into its own plugin
+and result objects so ``finalize`` looks exactly like a serial run.
+"""
+import multiprocessing
+import os
+
+import six
+from six import StringIO as IO
+from spec.cache import test_address
+from spec.schedule import is_container
+
+
+# Populated right before the worker pool forks; children read it back.
+_state = None
+
+
+def can_fork():
+    return hasattr(os, 'fork')
+
+
+class RemoteTest(object):
+    """
+    Picklable stand-in for a test object which ran in a worker process.
+
+    Offers just enough of the test API (``shortDescription``, ``address``,
+    ``str``) for result objects, `SpecPlugin.print_tracebacks` & friends.
+    """
+    def __init__(self, description, address=None):
+        self.description = description
+        self._address = address
+
+    @classmethod
+    def from_test(cls, test):
+        return cls(
+            test.shortDescription() or six.text_type(test),
+            test_address(test),
+        )
+
+    def shortDescription(self):
+        return self.description
+
+    def address(self):
+        return self._address
+
+    def __str__(self):
+        return self.description
+
+
+def split_suite(suite):
+    """
+    Yield the independently runnable pieces of ``suite``, in source order.
+
+    Directory & package suites are recursed into; test modules (and any bare
+    tests found at the top level) are yielded as-is.
+    """
+    for test in suite:
+        if is_container(test):
+            for piece in split_suite(test):
+                yield piece
+        else:
+            yield test
+
+
+def storages(result):
+    """
+    Map storage names to the result lists tests are recorded in.
+
+    Beyond errors & failures this includes nose's error classes (skip,
+    deprecated etc) keyed by label, skipping any aliasing an earlier list.
+    """
+    lists = {
+        'errors': result.errors,
+        'failures': result.failures,
+        'skipped': getattr(result, 'skipped', []),
+    }
+    for storage, label, isfail in getattr(result, 'errorClasses', {}).values():
+        if not any(storage is x for x in lists.values()):
+            lists[label] = storage
+    return lists
+
+
+def _run_chunk(index):
+    chunks, plugin, result = _state
+    # Start from a clean slate, then send plugin output to a buffer.
+    plugin._errors, plugin._failures = [], []
+    plugin._contexts, plugin._context_indices = [], {}
+    plugin._slow_tests, plugin._slow_contexts = [], []
+    plugin._timings = []
+    plugin.current_context = None
+    # Output the parent had buffered up when forking is the parent's to print.
+    plugin.stream.discard_pending()
+    buffer = IO()
+    plugin.stream.on_stream = buffer
+    chunks[index](result)
+    plugin.stream.flush_pending()
+
+    return {
+        'output': buffer.getvalue(),
+        'errors': plugin._errors,
+        'failures': plugin._failures,
+        'contexts': plugin._contexts,
+        'slow_tests': plugin._slow_tests,
+        'slow_contexts': plugin._slow_contexts,
+        'timings': plugin._timings,
+        'testsRun': result.testsRun,
+        'storages': dict(
+            (name, [(RemoteTest.from_test(test), info) for test, info in items])
+            for name, items in six.iteritems(storages(result))
+        ),
+    }
+
+
+class WorkerSuite(object):
+    """
+    Callable stand-in for a loaded suite which runs it across worker processes.
+    """
+    def __init__(self, suite, plugin, workers):
+        self.suite = suite
+        self.plugin = plugin
+        self.workers = workers
+
+    def __call__(self, result):
+        return self.run(result)
+
+    def run(self, result):
+        global _state
+        chunks = list(split_suite(self.suite))
+        _state = (chunks, self.plugin, result)
+        # Fork explicitly; other start methods would need to re-import and
+        # re-load everything we just loaded.
+        context = multiprocessing
+        if hasattr(multiprocessing, 'get_context'):
+            context = multiprocessing.get_context('fork')
+        # One fresh child per chunk keeps each one's plugin & result state
+        # pristine (i.e. identical to the parent's pre-run state.)
+        pool = context.Pool(self.workers, maxtasksperchild=1)
+        payloads = []
+        try:
+            for payload in pool.imap(_run_chunk, range(len(chunks))):
+                self.plugin.stream.print_text(payload['output'])
+                payloads.append(payload)
+                self.plugin.count_failures(
+                    len(payload['errors']) + len(payload['failures'])
+                )
+                if self.plugin.stopped:
+                    # Chunks still running are cut short by terminate().
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
+            _state = None
+        self.merge(payloads, result)
+        return result
+
+    def merge(self, payloads, result):
+        lists = storages(result)
+        for payload in payloads:
+            # Context indices are the child's; make them ours.
+            indices = [
+                self.plugin.context_index(x) for x in payload['contexts']
+            ]
+            for record in payload['errors'] + payload['failures']:
+                if record.context is not None:
+                    record.context = indices[record.context]
+            self.plugin._errors.extend(payload['errors'])
+            self.plugin._failures.extend(payload['failures'])
+            for item in payload['slow_tests']:
+                self.plugin.record_slowest(self.plugin._slow_tests, item)
+            for item in payload['slow_contexts']:
+                self.plugin.record_slowest(self.plugin._slow_contexts, item)
+            self.plugin._timings.extend(payload['timings'])
+            result.testsRun += payload['testsRun']
+            for name, items in six.iteritems(payload['storages']):
+                if name in lists:
+                    lists[name].extend(items)
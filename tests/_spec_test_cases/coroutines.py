@@ -0,0 +1,58 @@
+import asyncio
+import sys
+
+from spec import Spec, eq_, fixture, trap
+
+
+class Coroutines(Spec):
+    async def setup(self):
+        await asyncio.sleep(0)
+        self.ready = True
+
+    async def _helper(self):
+        await asyncio.sleep(0)
+        return asyncio.get_event_loop()
+
+    async def awaits_private_helpers(self):
+        assert self.ready
+        eq_(await self._helper(), asyncio.get_event_loop())
+
+    @trap
+    async def traps_output(self):
+        print("hi")
+        await asyncio.sleep(0)
+        eq_(sys.stdall.getvalue(), "hi\n")
+
+    async def fails_asynchronously(self):
+        await asyncio.sleep(0)
+        assert False
+
+    class concurrent_context:
+        concurrent_fixtures = True
+        loops = []
+
+        def setup_context(self):
+            # Loops of this run only, should the suite run again.
+            del self.loops[:]
+
+        @fixture
+        async def first(self):
+            self.started = getattr(self, 'started', 0) + 1
+            await asyncio.sleep(0.01)
+            # Only true if the other fixture started meanwhile
+            self.overlapped = self.started == 2
+
+        @fixture
+        async def second(self):
+            self.started = getattr(self, 'started', 0) + 1
+            await asyncio.sleep(0.01)
+
+        async def runs_fixtures_concurrently(self):
+            assert self.overlapped
+            # Set up by the outer context's (async) setup
+            assert self.ready
+            self.loops.append(asyncio.get_event_loop())
+
+        async def reuses_the_context_loop(self):
+            self.loops.append(asyncio.get_event_loop())
+            assert len(set(self.loops)) == 1
@@ -0,0 +1,7 @@
+def check_small(n, blob):
+    assert n < 8
+
+
+def test_numbers_are_small():
+    for n in range(10):
+        yield check_small, n, "x" * 200
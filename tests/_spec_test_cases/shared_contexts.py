@@ -0,0 +1,52 @@
+from spec import Spec
+
+
+EVENTS = []
+
+
+class Outer(Spec):
+    def setup_context(self):
+        # Start afresh if this module gets run more than once.
+        del EVENTS[:]
+        EVENTS.append("setup outer")
+        self.schema = "schema"
+
+    def teardown_context(self):
+        EVENTS.append("teardown outer")
+
+    def uses_the_context(self):
+        assert self.schema == "schema"
+
+    class inner:
+        def setup_context(self):
+            EVENTS.append("setup inner")
+            self.model = self.schema + " model"
+
+        def teardown_context(self):
+            EVENTS.append("teardown inner")
+
+        def shares_outer_context_state(self):
+            assert self.model == "schema model"
+
+        def sets_each_context_up_once(self):
+            assert EVENTS == ["setup outer", "setup inner"]
+
+        class deeper:
+            def sees_every_enclosing_context(self):
+                assert (self.schema, self.model) == ("schema", "schema model")
+
+    class sibling:
+        def follows_the_inner_context_teardown(self):
+            assert EVENTS[-1] == "teardown inner"
+            assert not hasattr(Outer.inner, 'model')
+
+    class broken:
+        def setup_context(self):
+            EVENTS.append("setup broken")
+            raise ValueError("broken context")
+
+        def errors(self):
+            pass
+
+        def errors_without_setting_up_again(self):
+            pass
@@ -1,12 +1,28 @@
 """Unit tests for Spec plugin.
 """
 
+import gc
+import importlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
 import nose
+import nose.tools
 import six
 from nose.plugins import PluginTester
 
-from spec import Spec
+from spec import Spec, SpecPlugin
+from spec.plugin import OutputStream, SpecOutputStream
+from spec.trap import trap
+from spec.cli import CustomSelector
+from spec import cache
+from spec.changed import ImportRecorder, install_dirs, is_project_file
 
 
 def _prepend_in_each_line(string, prefix='    '):
@@ -130,6 +146,51 @@ class TestPluginSpecWithTestGeneratorsWithDescriptions(_SpecPluginTestCase):
         self.assertContainsInOutput(self.expected_test_test_generators_with_descriptions_output)
 
 
+class TestPluginSpecWithCollapsedGenerators(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--spec-generators=collapse']
+    plugins = [SpecPlugin()]
+    suitename = 'generator_failures'
+
+    def test_prints_counts_and_failing_cases_only(self):
+        blob = "x" * 77 + "..."
+        self.assertContainsInOutput("""Numbers are small
+- holds for 8, %s
+- holds for 9, %s
+- 10 cases: 8 ok, 2 failed (""" % (blob, blob))
+        self.failIfContainsInOutput("- holds for 0,")
+
+    def test_truncates_failure_labels(self):
+        self.failIfContainsInOutput("x" * 200)
+        self.assertContainsInOutput("FAILED (failures=2,")
+
+    def test_only_bounds_argument_length(self):
+        from spec.plugin import argDescription, ARG_LIMIT
+        for arg in (
+            list(range(1, 8)), {'b': 1, 'a': 2, 'c': 3, 'd': 4, 'e': 5},
+            [[[[[[[1]]]]]]], (10 ** 50,),
+        ):
+            self.assertEqual(argDescription(arg, bounded=True), str(arg))
+        description = argDescription(list(range(10 ** 6)), bounded=True)
+        self.assertEqual(len(description), ARG_LIMIT)
+        self.assertTrue(description.startswith("[0, 1, 2, 3, 4, 5, 6, 7,"))
+
+
+class TestPluginSpecWithExpandedGeneratorFailures(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color']
+    plugins = [SpecPlugin()]
+    suitename = 'generator_failures'
+
+    def test_spells_out_arguments_in_full(self):
+        blob = "x" * 200
+        self.assertContainsInOutput("- holds for 0, %s\n" % blob)
+        self.assertContainsInOutput("- holds for 9, %s\n" % blob)
+        self.assertContainsInOutput(
+            "FAIL: generator_failures.test_numbers_are_small(9, '%s')" % blob
+        )
+
+
 class TestPluginSpecWithDoctests(_SpecPluginTestCase):
     activate = '--with-spec'
     args = ['--with-doctest', '--doctest-tests', '--spec-doctests', '--no-spec-color']
@@ -157,3 +218,940 @@ class TestPluginSpecWithDoctestsButDisabled(_SpecPluginTestCase):
     def test_doesnt_build_specifications_for_doctests_when_spec_doctests_option_wasnt_set(self):
         self.failIfContainsInOutput("test_doctests")
         self.failIfContainsInOutput("2 + 3 returns 5")
+
+
+class TestPluginSpecWithWorkers(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--spec-workers=2']
+    plugins = [SpecPlugin()]
+    suitename = 'foobaz'
+
+    expected_test_foobaz_output = """Foobaz
+- behaves such and such
+- causes an error
+- fails to satisfy this specification
+- throws deprecated exception
+- throws skip test exception
+"""
+
+    def test_prints_worker_output_in_the_parent(self):
+        self.assertContainsInOutput(self.expected_test_foobaz_output)
+
+    def test_merges_tracebacks_and_totals_from_workers(self):
+        self.assertContainsInOutput("ERROR: foobaz.TestFoobaz.test_causes_an_error")
+        self.assertContainsInOutput("Ran 5 tests")
+        self.assertContainsInOutput("FAILED (failures=1, errors=2")
+
+
+class TestPluginSpecWithWorkersOnManyModules(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--with-specselector', '--spec-workers=2']
+    plugins = [SpecPlugin(), CustomSelector()]
+    suitepath = '_spec_test_cases'
+
+    def setUp(self):
+        # Run the same suite serially first, to compare against.
+        args = self.args
+        self.args = [x for x in args if not x.startswith('--spec-workers')]
+        super(TestPluginSpecWithWorkersOnManyModules, self).setUp()
+        self.serial = self._without_runtime(self.output)
+        self.args = args
+        super(TestPluginSpecWithWorkersOnManyModules, self).setUp()
+
+    def _without_runtime(self, output):
+        return re.sub(r" in [\d.]+ ?s(econds)?", "", six.text_type(output))
+
+    def test_splits_the_suite_into_several_chunks(self):
+        from spec.workers import split_suite
+        from spec.cli import SpecSelector
+        loader = nose.loader.TestLoader()
+        loader.selector = SpecSelector(loader.config)
+        suite = loader.loadTestsFromDir(os.path.abspath(self.suitepath))
+        self.assertTrue(len(list(split_suite(suite))) > 1)
+
+    def test_output_and_totals_match_a_serial_run(self):
+        output = self._without_runtime(self.output)
+        self.assertEqual(output, self.serial)
+        self.assertContainsInOutput("Foobaz\n- behaves such and such")
+        self.assertContainsInOutput("Product of even numbers is even")
+
+
+class TestPluginSpecWithBufferedOutput(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--spec-buffer-output']
+    plugins = [SpecPlugin()]
+    suitename = 'foobaz'
+
+    def test_prints_the_same_specs(self):
+        self.assertContainsInOutput(
+            TestPluginSpecWithWorkers.expected_test_foobaz_output
+        )
+
+    def test_prints_specs_ahead_of_tracebacks(self):
+        output = six.text_type(self.output)
+        self.assertTrue(
+            output.index("- throws skip test exception")
+            < output.index("ERROR: foobaz.TestFoobaz.test_causes_an_error")
+        )
+
+    def test_writes_pending_text_in_one_go(self):
+        writes = []
+
+        class Target(object):
+            def write(self, text):
+                writes.append(text)
+
+        stream = SpecOutputStream(Target(), buffered=True)
+        stream.print_text("- one\n")
+        stream.print_text("- two\n")
+        self.assertEqual(writes, [])
+        stream.flush_pending()
+        self.assertEqual(writes, ["- one\n- two\n"])
+
+
+class TestPluginSpecWithImmediateReport(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--spec-report=immediate']
+    plugins = [SpecPlugin()]
+    suitename = 'foobaz'
+
+    def test_prints_tracebacks_under_their_specs(self):
+        output = six.text_type(self.output)
+        spec = output.index("- causes an error")
+        self.assertTrue(
+            spec < output.index("    Traceback (most recent call last)")
+            < output.index("- fails to satisfy this specification")
+        )
+        self.assertContainsInOutput("\n    NameError\n")
+        self.failIfContainsInOutput("ERROR: foobaz.TestFoobaz")
+
+
+class TestPluginSpecWithMaxfail(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--spec-maxfail=1']
+    plugins = [SpecPlugin()]
+    suitename = 'foobaz'
+
+    def test_stops_after_that_many_failures(self):
+        self.assertContainsInOutput("- causes an error")
+        self.failIfContainsInOutput("- fails to satisfy this specification")
+        self.assertContainsInOutput("Stopped after 1 failure (--spec-maxfail=1)")
+        self.assertContainsInOutput("Ran 2 tests")
+
+
+class TestPluginSpecResultRecords(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    plugins = [SpecPlugin()]
+    suitename = 'foobaz'
+
+    def test_keeps_slotted_records_instead_of_tests(self):
+        plugin = self.plugins[0]
+        records = plugin._errors + plugin._failures
+        eq_ = nose.tools.eq_
+        eq_([x.status for x in records], ['error', 'failure'])
+        for record in records:
+            assert not hasattr(record, '__dict__')
+            eq_(plugin._contexts[record.context], "Foobaz")
+            assert "Traceback" in "\n".join(record.message)
+        eq_(records[1].description, "fails to satisfy this specification")
+        eq_(records[1].id, "foobaz.TestFoobaz."
+                           "test_fails_to_satisfy_this_specification")
+
+    def test_records_survive_pickling(self):
+        import pickle
+        record = self.plugins[0]._failures[0]
+        copy = pickle.loads(pickle.dumps(record, 2))
+        for name in record.__slots__:
+            self.assertEqual(getattr(copy, name), getattr(record, name))
+
+
+class TestPluginSpecWithCoroutines(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--with-specselector']
+    plugins = [SpecPlugin(), CustomSelector()]
+    suitename = 'coroutines'
+
+    def setUp(self):
+        if sys.version_info < (3, 5):
+            raise nose.SkipTest("needs async def")
+        super(TestPluginSpecWithCoroutines, self).setUp()
+
+    def test_runs_coroutine_tests_and_fixtures(self):
+        self.assertContainsInOutput("""Coroutines
+- awaits private helpers
+- fails asynchronously
+- traps output
+
+    concurrent_context
+    - reuses the context loop
+    - runs fixtures concurrently
+""")
+        self.assertContainsInOutput("FAILED (failures=1, errors=0")
+
+
+class TestPluginSpecWithSharedContexts(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--with-specselector']
+    plugins = [SpecPlugin(), CustomSelector()]
+    suitename = 'shared_contexts'
+
+    def test_sets_up_contexts_once_and_tears_down_in_reverse(self):
+        self.assertContainsInOutput("Ran 7 tests")
+        self.assertContainsInOutput("FAILED (failures=0, errors=2")
+        self.assertEqual(sys.modules['shared_contexts'].EVENTS, [
+            "setup outer", "setup inner", "teardown inner", "setup broken",
+            "teardown outer",
+        ])
+
+
+class _CacheDirTestCase(_SpecPluginTestCase):
+    """
+    Points spec's on-disk state at a throwaway directory.
+    """
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        os.environ['NOSE_SPEC_CACHE_DIR'] = self.cache_dir
+        _SpecPluginTestCase.setUp(self)
+
+    def tearDown(self):
+        del os.environ['NOSE_SPEC_CACHE_DIR']
+        shutil.rmtree(self.cache_dir)
+
+
+class TestSelectorChangedMode(_CacheDirTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--with-specselector', '--changed']
+    plugins = [SpecPlugin(), CustomSelector()]
+    suitepath = '_spec_test_cases'
+
+    def test_reruns_only_modules_which_failed_or_changed(self):
+        self.assertContainsInOutput("Containers")
+        self._execPlugin()
+        self.assertContainsInOutput("Foobaz")
+        self.failIfContainsInOutput("Containers")
+        self.failIfContainsInOutput("Foobar")
+
+
+class TestChangedDependencies(unittest.TestCase):
+    def test_ignores_installed_packages_under_the_launch_directory(self):
+        root = cache.launch_dir
+        venv = os.path.join(root, 'venv', 'lib', 'site-packages', '')
+        self.assertTrue(is_project_file(
+            os.path.join(root, 'spec', 'cli.py'), [venv]
+        ))
+        self.assertFalse(is_project_file(venv + 'six.py', [venv]))
+        self.assertFalse(is_project_file(
+            os.path.join(os.path.dirname(root), 'elsewhere.py'), []
+        ))
+
+    def test_knows_where_python_and_installed_packages_live(self):
+        installed = install_dirs()
+        for module in (os, six):
+            path = cache.source_file(module.__file__)
+            self.assertTrue(any(path.startswith(x) for x in installed))
+
+    def test_records_import_module_calls(self):
+        original = importlib.import_module
+        recorder = ImportRecorder()
+        recorder.install()
+        try:
+            importlib.import_module('.schedule', 'spec')
+        finally:
+            recorder.uninstall()
+        self.assertIs(importlib.import_module, original)
+        self.assertIn('spec.schedule', recorder.edges[__name__])
+
+
+class TestSelectorLastFailed(_CacheDirTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--with-specselector', '--spec-last-failed']
+    plugins = [SpecPlugin(), CustomSelector()]
+    suitename = 'foobaz'
+    # Without nose's Deprecated plugin, DeprecatedTest counts as an error.
+    expected_test_foobaz_output = """Foobaz
+- causes an error
+- fails to satisfy this specification
+- throws deprecated exception
+"""
+
+    def test_reruns_only_tests_which_failed_last_time(self):
+        self.assertContainsInOutput("- behaves such and such")
+        self._execPlugin()
+        self.assertContainsInOutput(self.expected_test_foobaz_output)
+        self.failIfContainsInOutput("- behaves such and such")
+
+
+class TestSelectorRecordsFailures(_CacheDirTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--with-specselector']
+    plugins = [SpecPlugin(), CustomSelector()]
+    suitename = 'foobaz'
+
+    def _failed(self):
+        with open(os.path.join(self.cache_dir, 'failed.json')) as fd:
+            return [tuple(x) for x in json.load(fd)]
+
+    def test_keeps_failures_of_tests_which_did_not_run(self):
+        foobaz = os.path.abspath(self.suitepath)
+        foobar = os.path.abspath('_spec_test_cases/foobar.py')
+        failed = self._failed()
+        self.assertTrue((foobaz, 'TestFoobaz.test_causes_an_error') in failed)
+        elsewhere = (foobar, 'TestFoobar.test_is_a_singleton')
+        now_passing = (foobaz, 'TestFoobaz.test_behaves_such_and_such')
+        with open(os.path.join(self.cache_dir, 'failed.json'), 'w') as fd:
+            json.dump(failed + [elsewhere, now_passing], fd)
+        self._execPlugin()
+        self.assertEqual(self._failed(), sorted(failed + [elsewhere]))
+
+    def test_records_nothing_with_no_spec_cache(self):
+        os.remove(os.path.join(self.cache_dir, 'failed.json'))
+        self.argv.append('--no-spec-cache')
+        self._execPlugin()
+        self.assertFalse(
+            os.path.exists(os.path.join(self.cache_dir, 'failed.json'))
+        )
+
+
+class TestPluginSpecWithSlowest(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--spec-slowest=2']
+    plugins = [SpecPlugin()]
+    suitename = 'foobaz'
+
+    def test_lists_slowest_tests_including_failures(self):
+        self.assertContainsInOutput("Slowest 2 tests:\n")
+        output = six.text_type(self.output)
+        table = output.split("Slowest 2 tests:\n")[1].splitlines()[:2]
+        for row in table:
+            self.assertContains("s  Foobaz - ", row)
+
+    def test_lists_slowest_contexts_with_fixture_time(self):
+        self.assertContainsInOutput(
+            "Slowest 2 contexts (of which setup/teardown):\n"
+        )
+
+
+class TestPluginSpecWithJsonLines(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    plugins = [SpecPlugin()]
+    suitename = 'foobaz'
+
+    def setUp(self):
+        fd, self.jsonl = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        self.args = ['--no-spec-color', '--spec-jsonl=%s' % self.jsonl]
+        _SpecPluginTestCase.setUp(self)
+
+    def tearDown(self):
+        os.remove(self.jsonl)
+
+    def _records(self):
+        with open(self.jsonl) as fd:
+            return [json.loads(line) for line in fd]
+
+    def test_writes_one_record_per_test(self):
+        records = self._records()
+        self.assertEqual(len(records), 5)
+        for record in records:
+            self.assertEqual(record['contexts'], ['Foobaz'])
+            self.assertEqual(record['depth'], 0)
+            self.assertTrue(record['duration'] >= 0)
+            self.assertTrue(record['file'].endswith('foobaz.py'))
+
+    def test_records_status_and_traceback(self):
+        by_status = dict((x['status'], x) for x in self._records())
+        self.assertEqual(
+            sorted(by_status),
+            ['deprecated', 'error', 'failure', 'ok', 'skipped'],
+        )
+        failure = by_status['failure']
+        self.assertEqual(
+            failure['description'], "fails to satisfy this specification"
+        )
+        self.assertEqual(
+            failure['call'],
+            'TestFoobaz.test_fails_to_satisfy_this_specification'
+        )
+        self.assertContains("AssertionError", failure['traceback'])
+        self.assertEqual(by_status['ok']['traceback'], None)
+
+
+class TestPluginSpecWithTimingHistory(_CacheDirTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color', '--spec-order=slowest-first']
+    plugins = [SpecPlugin()]
+    suitename = 'foobaz'
+    # Unknown tests are expected to take the mean of the known ones, 2.5s.
+    expected_test_foobaz_output = """Foobaz
+- behaves such and such
+- fails to satisfy this specification
+- throws deprecated exception
+- throws skip test exception
+- causes an error
+"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        os.environ['NOSE_SPEC_CACHE_DIR'] = self.cache_dir
+        path = os.path.abspath(self.suitepath)
+        with open(os.path.join(self.cache_dir, 'timings.json'), 'w') as fd:
+            json.dump({path: {
+                'TestFoobaz.test_behaves_such_and_such': 5.0,
+                'TestFoobaz.test_causes_an_error': 0.0,
+            }}, fd)
+        _SpecPluginTestCase.setUp(self)
+
+    def test_runs_slowest_tests_first(self):
+        self.assertContainsInOutput(self.expected_test_foobaz_output)
+
+    def test_records_timings_of_tests_and_contexts(self):
+        with open(os.path.join(self.cache_dir, 'timings.json')) as fd:
+            timings = json.load(fd)[os.path.abspath(self.suitepath)]
+        self.assertEqual(len(timings), 7)
+        self.assertTrue('TestFoobaz' in timings)
+        self.assertTrue('' in timings)
+        # Running averages move towards the latest runtime.
+        self.assertTrue(timings['TestFoobaz.test_behaves_such_and_such'] < 5)
+
+
+class TestPluginSpecWithoutTimingHistory(_CacheDirTestCase):
+    activate = '--with-specplugin'
+    args = ['--no-spec-color']
+    plugins = [SpecPlugin()]
+    suitename = 'foobaz'
+
+    def test_leaves_timings_alone_unless_asked(self):
+        path = os.path.join(self.cache_dir, 'timings.json')
+        self.assertFalse(os.path.exists(path))
+        self.argv.append('--spec-record-timings')
+        self._execPlugin()
+        self.assertTrue(os.path.exists(path))
+
+    @trap
+    def test_reports_bad_shards_as_option_errors(self):
+        config = nose.config.Config(
+            plugins=nose.plugins.manager.PluginManager(plugins=[SpecPlugin()]),
+        )
+        self.assertRaises(SystemExit, config.configure, [
+            'nosetests', '--with-specplugin', '--spec-shard=0/2',
+        ])
+        self.assertContains(
+            "--spec-shard expects INDEX/TOTAL", sys.stderr.getvalue(),
+        )
+
+
+class TestPluginSpecWithShards(_CacheDirTestCase):
+    activate = '--with-specplugin'
+    args = [
+        '--no-spec-color', '--with-specselector', '--spec-shard-by=time',
+        '--spec-shard=1/3',
+    ]
+    plugins = [SpecPlugin(), CustomSelector()]
+    suitepath = '_spec_test_cases'
+    contexts = (
+        "Containers", "Coroutines", "This module", "Foobar", "Foobaz",
+        "Generator failures", "Generators", "Generators with descriptions",
+        "Outer",
+    )
+
+    def _ran(self, output):
+        return int(re.search(r"Ran (\d+) tests? in", output).group(1))
+
+    def test_back_to_back_shards_run_everything_exactly_once(self):
+        outputs = [six.text_type(self.output)]
+        for index in (2, 3):
+            self.argv[-2] = '--spec-shard=%d/3' % index
+            self._execPlugin()
+            outputs.append(six.text_type(self.output))
+        # Shards only read the shared history, so they agree on the split.
+        self.assertFalse(
+            os.path.exists(os.path.join(self.cache_dir, 'timings.json'))
+        )
+        for context in self.contexts:
+            self.assertEqual(
+                sum(context in x.splitlines() for x in outputs), 1, context,
+            )
+        del self.argv[-2]
+        self._execPlugin()
+        self.assertEqual(
+            sum(map(self._ran, outputs)), self._ran(six.text_type(self.output)),
+        )
+
+
+class TestMergeShardResults(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, *records):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as fd:
+            for description, contexts, status in records:
+                fd.write(json.dumps({
+                    'description': description,
+                    'contexts': contexts,
+                    'depth': len(contexts) - 1,
+                    'status': status,
+                    'duration': 0.5,
+                    'file': '/tests/%s.py' % contexts[0].lower(),
+                    'call': None,
+                    'traceback': "Boom\n" if status == 'failure' else None,
+                }) + "\n")
+        return path
+
+    def test_merges_trees_failures_and_summary(self):
+        from spec import merge
+        paths = [
+            self._write('1.jsonl',
+                ('passes', ['Outer'], 'ok'),
+                ('fails', ['Outer', 'inner'], 'failure')),
+            self._write('2.jsonl', ('works', ['Another'], 'ok')),
+        ]
+        stream = six.StringIO()
+        summary = merge.render(merge.load(paths), stream)
+        self.assertEqual(summary['tests'], 3)
+        self.assertEqual(summary['counts']['failure'], 1)
+        self.assertFalse(summary['successful'])
+        output = stream.getvalue()
+        self.assertTrue(output.startswith(
+            "\nAnother\n- works\n\nOuter\n- passes\n\n    inner\n"
+            "    - fails (failure)\n"
+        ))
+        self.assertTrue("FAIL: Outer inner - fails\n" in output)
+        self.assertTrue(output.endswith(
+            "Ran 3 tests (1.500 seconds of test time)\n"
+            "FAILED (failures=1, errors=0, skipped=0, deprecated=0)\n"
+        ))
+
+
+class TestPluginSpecWithHashedShards(_SpecPluginTestCase):
+    activate = '--with-specplugin'
+    args = [
+        '--no-spec-color', '--with-specselector', '--no-spec-cache',
+        '--spec-shard=1/3',
+    ]
+    plugins = [SpecPlugin(), CustomSelector()]
+    suitepath = '_spec_test_cases'
+    contexts = ("Containers\n", "Foobar\n", "Baz bar\n", "Foobaz\n")
+
+    def test_each_top_level_context_runs_in_exactly_one_shard(self):
+        outputs = [six.text_type(self.output)]
+        for index in (2, 3):
+            self.argv[-2] = '--spec-shard=%s/3' % index
+            self._execPlugin()
+            outputs.append(six.text_type(self.output))
+        for context in self.contexts:
+            self.assertEqual(sum(context in x for x in outputs), 1)
+
+
+class TestContextDescriptions(unittest.TestCase):
+    def test_forgets_descriptions_of_contexts_which_are_gone(self):
+        from spec.plugin import _context_descriptions, contextDescription
+        TestThrowaway = type('TestThrowaway', (object,), {})
+        key = id(TestThrowaway)
+        self.assertEqual(contextDescription(TestThrowaway), "Throwaway")
+        self.assertIn(key, _context_descriptions)
+        del TestThrowaway
+        gc.collect()
+        self.assertNotIn(key, _context_descriptions)
+
+    def test_ignores_entries_of_other_objects_with_the_same_id(self):
+        import weakref
+        from spec.plugin import _context_descriptions, contextDescription
+
+        class TestStale(object):
+            pass
+
+        class TestFresh(object):
+            pass
+        # As if TestStale's id had been reused by TestFresh.
+        _context_descriptions[id(TestFresh)] = (
+            weakref.ref(TestStale), "Stale",
+        )
+        self.assertEqual(contextDescription(TestFresh), "Fresh")
+        self.assertEqual(contextDescription(TestFresh), "Fresh")
+
+
+class TestOutputStreamCapture(unittest.TestCase):
+    def test_capture_starts_afresh_each_time(self):
+        stream = OutputStream(six.StringIO())
+        stream.capture()
+        stream.write("first test's output")
+        stream.capture()
+        stream.write("second")
+        self.assertEqual(stream.get_captured(), "second")
+
+    def test_capture_keeps_at_most_the_limit(self):
+        stream = OutputStream(six.StringIO(), capture_limit=10)
+        stream.capture()
+        stream.write("0123456")
+        stream.write("789abc")
+        self.assertEqual(stream.get_captured(), "0123456789")
+        self.assertEqual(stream.capture_stream.dropped, 3)
+
+    def test_zero_limit_discards_captured_output(self):
+        stream = OutputStream(six.StringIO(), capture_limit=0)
+        stream.capture()
+        stream.write("gone")
+        self.assertEqual(stream.get_captured(), "")
+
+    def test_off_discards_output(self):
+        target = six.StringIO()
+        stream = OutputStream(target)
+        stream.off()
+        stream.write("gone")
+        stream.on()
+        stream.write("kept")
+        self.assertEqual(target.getvalue(), "kept")
+
+
+class TestPluginTracebackLimits(unittest.TestCase):
+    def setUp(self):
+        self.plugin = SpecPlugin()
+        self.plugin.traceback_frames = 0
+        self.plugin.traceback_size = 0
+
+    def _error(self, depth):
+        def recurse(n):
+            if n:
+                recurse(n - 1)
+            raise ValueError("x" * 1000)
+        try:
+            recurse(depth)
+        except ValueError:
+            return sys.exc_info()
+
+    def test_keeps_only_innermost_frames(self):
+        self.plugin.traceback_frames = 3
+        lines = self.plugin.format_traceback(self._error(10))
+        self.assertEqual(lines[1], "  ... 9 outermost frames omitted ...")
+        self.assertEqual(
+            len([x for x in lines if x.startswith("  File")]), 3
+        )
+        self.assertTrue(lines[-2].startswith("ValueError: xxx"))
+
+    def test_trims_the_middle_of_oversized_tracebacks(self):
+        self.plugin.traceback_size = 1200
+        lines = self.plugin.format_traceback(self._error(50))
+        self.assertTrue(sum(len(x) + 1 for x in lines) < 1300)
+        self.assertEqual(lines[0], "Traceback (most recent call last):")
+        self.assertTrue(any(x.endswith("characters omitted ...") for x in lines))
+        self.assertTrue(lines[-2].startswith("ValueError: xxx"))
+
+
+class TestLazyImports(unittest.TestCase):
+    def _imported(self, statement):
+        code = "import sys\n%s\nprint(' '.join(sorted(sys.modules)))" % (
+            statement,
+        )
+        output = subprocess.check_output([sys.executable, "-c", code])
+        return output.decode('utf-8').split()
+
+    def test_importing_spec_skips_nose_and_the_plugin(self):
+        if sys.version_info < (3, 7):
+            raise nose.SkipTest("needs module-level __getattr__")
+        modules = self._imported("from spec import Spec, eq_, ok_")
+        for name in ('nose', 'doctest', 'spec.plugin', 'spec.cli'):
+            self.assertFalse(name in modules, name)
+
+    def test_loads_the_rest_on_first_use(self):
+        import spec
+        self.assertTrue(spec.SpecPlugin is SpecPlugin)
+        self.assertTrue(spec.assert_equal is nose.tools.assert_equal)
+        self.assertTrue(spec.SkipTest is nose.SkipTest)
+        namespace = {}
+        exec("from spec import *", namespace)
+        self.assertTrue(namespace['raises'] is nose.tools.raises)
+        self.assertTrue(namespace['eq_'] is spec.eq_)
+
+
+class TestAssertionHelpers(unittest.TestCase):
+    def _message(self, func, *args):
+        try:
+            func(*args)
+        except AssertionError as e:
+            message = e.args[0]
+            if isinstance(message, bytes):
+                message = message.decode('utf-8')
+            return message
+        self.fail("%s didn't fail" % func.__name__)
+
+    def test_eq_only_formats_operands_on_failure(self):
+        from spec import eq_
+
+        class Unprintable(object):
+            def __eq__(self, other):
+                return True
+
+            def __repr__(self):
+                raise AssertionError("formatted")
+            __str__ = __repr__
+
+        eq_(Unprintable(), Unprintable())
+
+    def test_eq_diffs_large_multiline_strings(self):
+        from spec import eq_, DIFF_LIMIT
+        expected = "\n".join("line %d" % x for x in range(1000))
+        result = expected.replace("line", "LINE")
+        message = self._message(eq_, result, expected)
+        self.assertTrue("--- expected\n+++ got" in message)
+        self.assertTrue("-line 0\n" in message)
+        self.assertTrue("more diff lines ..." in message)
+        self.assertTrue(len(message.splitlines()) <= DIFF_LIMIT + 2)
+
+    def test_eq_diffs_line_endings(self):
+        from spec import eq_
+        message = self._message(eq_, "x\r\n" * 30, "x\n" * 30)
+        self.assertTrue("-x\n+x\\r\n" in message)
+        message = self._message(eq_, "x\n" * 29 + "x", "x\n" * 30)
+        self.assertTrue("+x\n\\ No newline at end of file" in message)
+
+    def test_assert_contains_bounds_huge_haystacks(self):
+        from spec import assert_contains, HAYSTACK_LIMIT
+        message = self._message(assert_contains, "x" * 100000, "y")
+        self.assertTrue("characters omitted" in message)
+        self.assertTrue(len(message) < HAYSTACK_LIMIT + 100)
+
+    def test_assert_contains_caches_a_bounded_number_of_patterns(self):
+        import spec
+        spec._patterns.clear()
+        for x in range(spec.PATTERN_CACHE_SIZE + 10):
+            spec.assert_contains("line 1\nline 2", r"^line \d$")
+            spec.assert_not_contains("line", "needle %d" % x)
+        self.assertEqual(len(spec._patterns), spec.PATTERN_CACHE_SIZE)
+        self.assertTrue(r"^line \d$" in spec._patterns)
+
+    def test_assert_contains_escaped_needles_are_plain_text(self):
+        from spec import assert_contains, assert_not_contains
+        assert_contains("costs $5 (or so)", "$5 (or", escape=True)
+        assert_not_contains("costs $5", "$.", escape=True)
+
+    def test_assert_contains_all_reports_every_missing_needle(self):
+        from spec import assert_contains_all
+        haystack = "foo bar\nbaz"
+        assert_contains_all(haystack, ["^baz", "bar$", "o+ b"])
+        assert_contains_all(haystack, ["o b", "r\nb"], escape=True)
+        message = self._message(
+            assert_contains_all, haystack, ["nope", "baz", "^bar"],
+        )
+        self.assertTrue(message.startswith("'nope', '^bar' not found in"))
+
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'module.py')
+        with open(self.path, 'w') as fd:
+            fd.write("x = 1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _notices_changes(self, watcher):
+        try:
+            self.assertEqual(watcher.wait(0.05), set())
+            with open(self.path, 'w') as fd:
+                fd.write("x = 22\n")
+            os.mkdir(os.path.join(self.root, 'pkg'))
+            time.sleep(0.05)
+            with open(os.path.join(self.root, 'pkg', 'new.py'), 'w') as fd:
+                fd.write("")
+            changed = set()
+            deadline = time.time() + 5
+            while len(changed) < 2 and time.time() < deadline:
+                changed |= watcher.wait(0.5)
+            self.assertEqual(changed, set([
+                self.path, os.path.join(self.root, 'pkg', 'new.py'),
+            ]))
+        finally:
+            watcher.close()
+
+    def test_polling_notices_changed_and_new_files(self):
+        from spec.watch import PollingWatcher
+        watcher = PollingWatcher(self.root)
+        watcher.interval = 0.01
+        self._notices_changes(watcher)
+
+    def test_inotify_notices_changed_and_new_files(self):
+        from spec.watch import InotifyWatcher
+        try:
+            watcher = InotifyWatcher(self.root)
+        except (OSError, AttributeError):
+            raise nose.SkipTest("no inotify here")
+        self._notices_changes(watcher)
+
+    def test_finds_transitive_importers(self):
+        from spec.watch import importers
+        edges = {
+            'tests.a': set(['proj.models', 'six']),
+            'tests.b': set(['proj.views']),
+            'proj.views': set(['proj.models']),
+            'tests.c': set(['six']),
+        }
+        self.assertEqual(
+            importers(edges, ['proj.models']),
+            set(['proj.models', 'proj.views', 'tests.a', 'tests.b']),
+        )
+
+    def test_reruns_only_affected_test_modules(self):
+        import select
+        import signal
+        os.mkdir(os.path.join(self.root, 'tests'))
+        for name in ('alpha', 'beta'):
+            with open(os.path.join(self.root, 'tests', name + '.py'), 'w') as fd:
+                fd.write("def test_%s_works():\n    pass\n" % name)
+        # Given test names and all, which reruns must not fall back to.
+        watch = subprocess.Popen(
+            [sys.executable, '-c', 'from spec.cli import main; main()',
+             '--watch', '--no-spec-color', '--no-spec-cache', '.'],
+            cwd=self.root, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        )
+        output = []
+
+        def read_until(text):
+            deadline = time.time() + 20
+            while text not in "".join(output) and time.time() < deadline:
+                if select.select([watch.stdout], [], [], 0.1)[0]:
+                    output.append(os.read(watch.stdout.fileno(), 4096).decode('utf-8'))
+            return "".join(output)
+        try:
+            read_until("Watching for changes")
+            del output[:]
+            with open(os.path.join(self.root, 'tests', 'beta.py'), 'a') as fd:
+                fd.write("def test_beta_still_works():\n    pass\n")
+            rerun = read_until("Watching for changes")
+        finally:
+            watch.send_signal(signal.SIGINT)
+            watch.communicate()
+        self.assertTrue("- beta still works" in rerun, rerun)
+        self.assertTrue("Ran 2 tests" in rerun, rerun)
+        self.assertFalse("Alpha" in rerun, rerun)
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        if not hasattr(os, 'fork'):
+            raise nose.SkipTest("needs fork()")
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, 'tests'))
+        with open(os.path.join(self.root, 'tests', 'pids.py'), 'w') as fd:
+            fd.write(
+                "import os\n"
+                "def test_prints_its_parent():\n"
+                "    print('PPID %d' % os.getppid())\n"
+                "def test_fails():\n"
+                "    assert False\n"
+            )
+        from spec.daemon import socket_path
+        self.socket = socket_path(directory=os.path.realpath(self.root))
+        self.daemon = self._spec('--daemon', stderr=subprocess.PIPE)
+        deadline = time.time() + 20
+        while not os.path.exists(self.socket) and time.time() < deadline:
+            time.sleep(0.05)
+
+    def tearDown(self):
+        if self.daemon.poll() is None:
+            self.daemon.terminate()
+        self.daemon.wait()
+        self.daemon.stderr.close()
+        shutil.rmtree(self.root)
+
+    def _spec(self, *args, **kwargs):
+        return subprocess.Popen(
+            [sys.executable, '-c', 'from spec.daemon import main; main()']
+            + list(args),
+            cwd=self.root, **kwargs
+        )
+
+    def test_runs_clients_in_forked_children(self):
+        client = self._spec(
+            '--no-spec-color', stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        )
+        output = client.communicate()[0].decode('utf-8')
+        self.assertEqual(client.returncode, 1)
+        self.assertTrue("PPID %d" % self.daemon.pid in output, output)
+        self.assertTrue("- prints its parent" in output, output)
+        self.assertTrue("FAILED (failures=1" in output, output)
+
+    def test_keeps_its_socket_to_its_user(self):
+        import stat
+        mode = lambda x: stat.S_IMODE(os.stat(x).st_mode)
+        self.assertEqual(mode(self.socket), 0o600)
+        self.assertEqual(mode(os.path.dirname(self.socket)), 0o700)
+
+    def test_clients_only_talk_to_their_own_sockets(self):
+        if os.getuid() != 0:
+            raise nose.SkipTest("needs root, to give the socket away")
+        os.chown(self.socket, 65534, -1)
+        client = self._spec(
+            '--no-spec-color', stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        )
+        output = client.communicate()[0].decode('utf-8')
+        self.assertTrue("isn't a socket of yours" in output, output)
+        self.assertTrue("PPID %d" % os.getpid() in output, output)
+
+    def test_cleans_up_its_socket_when_terminated(self):
+        self.assertTrue(os.path.exists(self.socket))
+        self.daemon.terminate()
+        self.daemon.wait()
+        self.assertFalse(os.path.exists(self.socket))
+
+
+class TestTrap(unittest.TestCase):
+    def test_captures_each_stream_and_both_interleaved(self):
+        @trap
+        def chatty():
+            sys.stdout.write(u"out \u2603\n")
+            sys.stderr.write("err\n")
+            sys.stdout.buffer.write(u"\u2603 bytes\n".encode('utf-8'))
+            first = sys.stdout.getvalue()
+            sys.stdout.write("more\n")
+            return (
+                first, sys.stdout.getvalue(), sys.stderr.getvalue(),
+                sys.stdall.getvalue(),
+            )
+        first, out, err, both = chatty()
+        self.assertEqual(first, u"out \u2603\n\u2603 bytes\n")
+        self.assertEqual(out, u"out \u2603\n\u2603 bytes\nmore\n")
+        self.assertEqual(err, "err\n")
+        self.assertEqual(both, u"out \u2603\nerr\n\u2603 bytes\nmore\n")
+
+    def test_truncates_output_past_the_limit(self):
+        @trap(limit=10)
+        def chatty():
+            sys.stdout.write("x" * 8)
+            sys.stdout.write("y" * 8)
+            sys.stderr.write("z" * 3)
+            return sys.stdall.getvalue(), sys.stdall.capture.dropped
+        self.assertEqual(chatty(), ("x" * 8 + "yy[output truncated]", 9))
+
+    def test_truncates_bytes_between_characters(self):
+        @trap(limit=4)
+        def chatty():
+            sys.stdout.buffer.write(u"ab\u2603".encode('utf-8'))
+            return sys.stdout.getvalue()
+        self.assertEqual(chatty(), "ab[output truncated]")
+
+    def test_decodes_bytes_split_across_writes_per_stream(self):
+        snowman = u"\u2603".encode('utf-8')
+        @trap
+        def chatty():
+            sys.stdout.buffer.write(snowman[:2])
+            sys.stderr.buffer.write(b"err ")
+            sys.stdout.buffer.write(snowman[2:])
+            return sys.stdout.getvalue(), sys.stdall.getvalue()
+        self.assertEqual(chatty(), (u"\u2603", u"err \u2603"))
+
+    def test_spills_output_past_the_limit_to_a_file(self):
+        @trap(limit=10, spill=True)
+        def chatty():
+            for x in range(1000):
+                sys.stdout.write("line %d\n" % x)
+                sys.stderr.write(u"\u2603\n")
+            assert sys.stdall.capture.file is not None
+            return sys.stdout.getvalue(), sys.stderr.getvalue()
+        out, err = chatty()
+        self.assertEqual(out, "".join("line %d\n" % x for x in range(1000)))
+        self.assertEqual(err, u"\u2603\n" * 1000)